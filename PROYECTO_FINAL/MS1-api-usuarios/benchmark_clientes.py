@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del camino en caliente de validación de tokens
+
+Compara la latencia de un get_item sobre la tabla de tokens:
+- antes: boto3.resource('dynamodb') + Table(...) en cada invocación
+- después: recurso y tabla reutilizados desde utils.recursos_aws
+
+Se ejecuta contra DynamoDB Local:
+    docker run -p 8000:8000 amazon/dynamodb-local
+    python benchmark_clientes.py --endpoint http://localhost:8000 --iteraciones 500
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import boto3
+
+TABLA = 'bench-t_MS1_tokens_acceso'
+CREDENCIALES_LOCALES = {
+    'region_name': 'us-east-1',
+    'aws_access_key_id': 'local',
+    'aws_secret_access_key': 'local'
+}
+
+
+def preparar_tabla(endpoint):
+    """Crea la tabla de prueba (si no existe) y un token válido"""
+    dynamodb = boto3.resource('dynamodb', endpoint_url=endpoint, **CREDENCIALES_LOCALES)
+    if TABLA not in [t.name for t in dynamodb.tables.all()]:
+        dynamodb.create_table(
+            TableName=TABLA,
+            AttributeDefinitions=[{'AttributeName': 'token', 'AttributeType': 'S'}],
+            KeySchema=[{'AttributeName': 'token', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST'
+        ).wait_until_exists()
+    dynamodb.Table(TABLA).put_item(Item={
+        'token': 'token-benchmark',
+        'expires': int(time.time()) + 3600,
+        'user_id': 'bench',
+        'tenant_id': 'bench'
+    })
+
+
+def medir(funcion, iteraciones):
+    """Ejecuta la función N veces y devuelve las latencias en milisegundos"""
+    funcion()  # calentamiento
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def imprimir(nombre, tiempos):
+    tiempos = sorted(tiempos)
+    p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+    print(f"{nombre:10} media={statistics.mean(tiempos):7.2f} ms  p50={statistics.median(tiempos):7.2f} ms  p95={p95:7.2f} ms")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de reutilización de clientes DynamoDB')
+    parser.add_argument('--endpoint', default='http://localhost:8000')
+    parser.add_argument('--iteraciones', type=int, default=200)
+    args = parser.parse_args()
+
+    # utils.recursos_aws lee el endpoint y las credenciales del entorno
+    os.environ['DYNAMODB_ENDPOINT'] = args.endpoint
+    os.environ.setdefault('AWS_DEFAULT_REGION', CREDENCIALES_LOCALES['region_name'])
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', CREDENCIALES_LOCALES['aws_access_key_id'])
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', CREDENCIALES_LOCALES['aws_secret_access_key'])
+    from utils.recursos_aws import obtener_tabla
+
+    preparar_tabla(args.endpoint)
+    print(f"🚀 {args.iteraciones} get_item contra {args.endpoint}")
+
+    def antes():
+        tabla = boto3.resource('dynamodb', endpoint_url=args.endpoint).Table(TABLA)
+        tabla.get_item(Key={'token': 'token-benchmark'})
+
+    def despues():
+        obtener_tabla(TABLA).get_item(Key={'token': 'token-benchmark'})
+
+    imprimir('antes', medir(antes, args.iteraciones))
+    imprimir('despues', medir(despues, args.iteraciones))
+
+
+if __name__ == "__main__":
+    main()
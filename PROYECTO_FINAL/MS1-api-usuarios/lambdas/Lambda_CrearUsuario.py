@@ -1,7 +1,7 @@
-import boto3
 import hashlib
 import json
 import os  # para acceder a variables de entorno
+from utils.recursos_aws import obtener_tabla
 
 # Headers CORS para todas las respuestas
 cors_headers = {
@@ -51,8 +51,7 @@ def lambda_handler(event, context):
 
         # Obtener el nombre de la tabla desde la variable de entorno
         table_name = os.environ['TABLE_NAME']
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table(table_name)
+        table = obtener_tabla(table_name)
 
         item = {
             'user_id': user_id,
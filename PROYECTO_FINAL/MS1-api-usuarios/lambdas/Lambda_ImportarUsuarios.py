@@ -0,0 +1,168 @@
+import csv
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+
+import boto3
+from botocore.exceptions import ClientError
+
+from lambdas.Lambda_CrearUsuario import hash_password
+from utils.recursos_aws import obtener_dynamodb, obtener_tabla
+
+# Importación masiva de usuarios para el alta de un tenant.
+# Se dispara al subir importaciones/*.csv o importaciones/*.ndjson al bucket de
+# importaciones (o invocándola con {"bucket": ..., "key": ...}). El archivo se
+# lee en streaming y se procesa en bloques de 100 filas: hash de passwords,
+# lectura de los user_id que ya existen y alta del resto con put_item
+# condicional (attribute_not_exists), así un usuario creado entre la lectura y
+# la escritura no se sobrescribe.
+# El resultado de cada fila queda en resultados/<archivo>.ndjson.
+
+TAMANO_BLOQUE = 100        # límite de batch_get_item por llamada
+MAX_REINTENTOS = 5         # reintentos para UnprocessedKeys
+WORKERS = int(os.environ.get('IMPORTACION_WORKERS', '4'))
+
+s3_client = boto3.client('s3')
+
+def leer_filas(bucket, key):
+    # Itera el objeto línea a línea sin descargarlo completo
+    lineas = (linea.decode('utf-8-sig') for linea in s3_client.get_object(Bucket=bucket, Key=key)['Body'].iter_lines())
+    if key.endswith('.csv'):
+        yield from csv.DictReader(lineas)
+        return
+    for linea in lineas:
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        yield fila if isinstance(fila, dict) else {}
+
+def con_reintentos(llamada, clave_pendientes, solicitud):
+    # Reintenta con backoff exponencial lo que DynamoDB devuelve sin procesar
+    respuestas = []
+    for intento in range(MAX_REINTENTOS + 1):
+        respuesta = llamada(RequestItems=solicitud)
+        respuestas.append(respuesta)
+        solicitud = respuesta.get(clave_pendientes) or {}
+        if not solicitud:
+            return respuestas, {}
+        if intento < MAX_REINTENTOS:
+            time.sleep(0.05 * (2 ** intento))
+    return respuestas, solicitud
+
+def procesar_bloque(table_name, bloque):
+    """Da de alta un bloque de filas ya validadas. Devuelve {user_id: (estado, error)}"""
+    dynamodb = obtener_dynamodb()
+
+    # Primero se leen los user_id que ya existen (un batch_get_item por bloque)
+    # para no gastar escrituras en ellos; la condición del put cubre el resto
+    respuestas, sin_leer = con_reintentos(
+        dynamodb.batch_get_item, 'UnprocessedKeys',
+        {table_name: {'Keys': [{'user_id': fila['user_id']} for fila in bloque], 'ProjectionExpression': 'user_id'}}
+    )
+    if sin_leer:
+        return {fila['user_id']: ('error', 'No se pudo verificar si el usuario existe') for fila in bloque}
+    existentes = {item['user_id'] for r in respuestas for item in r.get('Responses', {}).get(table_name, [])}
+
+    resultados = {user_id: ('existe', None) for user_id in existentes}
+    nuevos = []
+    for fila in bloque:
+        if fila['user_id'] in existentes:
+            continue
+        item = {'user_id': fila['user_id'], 'password': hash_password(fila['password']), 'tenant_id': fila['tenant_id']}
+        if fila.get('name'):
+            item['name'] = fila['name']
+        nuevos.append(item)
+
+    # batch_write_item no admite condiciones: put_item con attribute_not_exists
+    # para no pisar un usuario creado por CrearUsuario u otra importación
+    table = obtener_tabla(table_name)
+    for item in nuevos:
+        try:
+            table.put_item(Item=item, ConditionExpression='attribute_not_exists(user_id)')
+            resultados[item['user_id']] = ('creado', None)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                resultados[item['user_id']] = ('existe', None)
+            else:
+                resultados[item['user_id']] = ('error', e.response['Error']['Code'])
+    return resultados
+
+def importar(bucket, key, table_name):
+    contadores = {'creado': 0, 'existe': 0, 'duplicado': 0, 'invalido': 0, 'error': 0}
+    vistos = set()
+
+    with tempfile.TemporaryFile('w+b') as salida, ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        def escribir(fila_n, user_id, estado, error=None):
+            contadores[estado] += 1
+            registro = {'fila': fila_n, 'user_id': user_id, 'estado': estado}
+            if error:
+                registro['error'] = error
+            salida.write((json.dumps(registro) + '\n').encode('utf-8'))
+
+        def drenar(en_curso, maximo):
+            # Acota los bloques en vuelo para que la memoria no crezca con el archivo
+            while len(en_curso) > maximo:
+                futuro, filas = en_curso.pop(0)
+                try:
+                    resultados = futuro.result()
+                except Exception as e:
+                    # Un bloque que falla (throttling, permisos...) no corta la importación
+                    print("Error en bloque:", str(e))
+                    resultados = {fila['user_id']: ('error', str(e)) for _, fila in filas}
+                for fila_n, fila in filas:
+                    estado, error = resultados.get(fila['user_id'], ('error', 'Sin resultado'))
+                    escribir(fila_n, fila['user_id'], estado, error)
+
+        en_curso, bloque = [], []
+        for fila_n, fila in enumerate(leer_filas(bucket, key), start=1):
+            # En NDJSON los campos pueden venir como números, listas u objetos
+            if not all(isinstance(fila.get(campo), str) for campo in ('user_id', 'password', 'tenant_id')):
+                escribir(fila_n, None, 'invalido', 'user_id, password y tenant_id son requeridos y deben ser texto')
+                continue
+            user_id = fila['user_id'].strip()
+            if not user_id or not fila['password'] or not fila['tenant_id']:
+                escribir(fila_n, user_id or None, 'invalido', 'user_id, password y tenant_id son requeridos')
+                continue
+            if user_id in vistos:
+                escribir(fila_n, user_id, 'duplicado', 'user_id repetido en el archivo')
+                continue
+            vistos.add(user_id)
+            bloque.append((fila_n, dict(fila, user_id=user_id)))
+
+            if len(bloque) == TAMANO_BLOQUE:
+                en_curso.append((pool.submit(procesar_bloque, table_name, [f for _, f in bloque]), bloque))
+                bloque = []
+                drenar(en_curso, WORKERS * 2)
+
+        if bloque:
+            en_curso.append((pool.submit(procesar_bloque, table_name, [f for _, f in bloque]), bloque))
+        drenar(en_curso, 0)
+
+        salida.seek(0)
+        nombre = key.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        resultados_key = f"resultados/{nombre}.ndjson"
+        s3_client.upload_fileobj(salida, bucket, resultados_key, ExtraArgs={'ContentType': 'application/x-ndjson'})
+
+    return dict(contadores, archivo=key, resultados=f"s3://{bucket}/{resultados_key}")
+
+def lambda_handler(event, context):
+    print(event)
+
+    # Evento de S3 (uno o más archivos) o invocación directa con bucket y key
+    archivos = [
+        (r['s3']['bucket']['name'], unquote_plus(r['s3']['object']['key']))
+        for r in event.get('Records', [])
+    ] or [(event['bucket'], event['key'])]
+
+    resumenes = []
+    for bucket, key in archivos:
+        resumen = importar(bucket, key, os.environ['TABLE_NAME'])
+        print("Importación terminada:", resumen)
+        resumenes.append(resumen)
+    return resumenes
@@ -1,9 +1,11 @@
-import boto3
 import hashlib
 import uuid
-from datetime import datetime, timedelta
+import time
 import json
 import os  # para leer variables de entorno
+from boto3.dynamodb.conditions import Attr, Key
+from utils.recursos_aws import obtener_tabla
+from utils.tokens import TOKEN_DURACION_SEGUNDOS, firmar_token, tokens_firmados_activos
 
 # Headers CORS para todas las respuestas
 cors_headers = {
@@ -13,9 +15,28 @@ cors_headers = {
     'Access-Control-Allow-Methods': 'POST, OPTIONS'
 }
 
+# Un token existente se reutiliza mientras le queden más de estos segundos de vigencia
+TOKEN_RENOVAR_SEGUNDOS = int(os.environ.get('TOKEN_RENOVAR_SEGUNDOS', '300'))
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+def buscar_token_vigente(table_tokens, user_id, tenant_id, minimo_expires):
+    # Consulta el índice por user_id; el filtro descarta tokens vencidos que el TTL aún no borró
+    kwargs = {
+        'IndexName': 'user_id-index',
+        'KeyConditionExpression': Key('user_id').eq(user_id),
+        'FilterExpression': Attr('expires').gt(minimo_expires) & Attr('tenant_id').eq(tenant_id)
+    }
+    vigentes = []
+    while True:
+        respuesta = table_tokens.query(**kwargs)
+        vigentes.extend(respuesta.get('Items', []))
+        if 'LastEvaluatedKey' not in respuesta:
+            break
+        kwargs['ExclusiveStartKey'] = respuesta['LastEvaluatedKey']
+    return max(vigentes, key=lambda item: item['expires'], default=None)
+
 def lambda_handler(event, context):
     print("Evento recibido:", event)
     
@@ -51,11 +72,9 @@ def lambda_handler(event, context):
 
         hashed_password = hash_password(password)
 
-        dynamodb = boto3.resource('dynamodb')
-
         # Leer nombre de tabla de usuarios desde variable de entorno
         table_name = os.environ['TABLE_NAME']
-        table = dynamodb.Table(table_name)
+        table = obtener_tabla(table_name)
         response = table.get_item(Key={ 'user_id': user_id })
         print("Respuesta DynamoDB:", response)
 
@@ -83,15 +102,41 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'El usuario no tiene tenant_id'})
             }
 
-        token = str(uuid.uuid4())
-        fecha_hora_exp = datetime.now() + timedelta(minutes=60)
+        # Expiración en segundos epoch (atributo TTL de la tabla de tokens)
+        expires = int(time.time()) + TOKEN_DURACION_SEGUNDOS
+
+        # Modo firmado: token autocontenido, no se guarda en la tabla de tokens
+        if tokens_firmados_activos():
+            token = firmar_token(user_id, tenant_id, expires)
+            return {
+                'statusCode': 200,
+                'headers': cors_headers,
+                'body': json.dumps({
+                    'token': token,
+                    'tenant_id': tenant_id
+                })
+            }
 
         # Leer nombre de tabla de tokens desde variable de entorno
         tokens_table_name = os.environ['TOKENS_TABLE']
-        table_tokens = dynamodb.Table(tokens_table_name)
+        table_tokens = obtener_tabla(tokens_table_name)
+
+        # Reutilizar la sesión vigente del usuario en lugar de escribir un token nuevo
+        vigente = buscar_token_vigente(table_tokens, user_id, tenant_id, int(time.time()) + TOKEN_RENOVAR_SEGUNDOS)
+        if vigente:
+            return {
+                'statusCode': 200,
+                'headers': cors_headers,
+                'body': json.dumps({
+                    'token': vigente['token'],
+                    'tenant_id': tenant_id
+                })
+            }
+
+        token = str(uuid.uuid4())
         table_tokens.put_item(Item={
             'token': token,
-            'expires': fecha_hora_exp.strftime('%Y-%m-%d %H:%M:%S'),
+            'expires': expires,
             'user_id': user_id,
             'tenant_id': tenant_id  # ← agregado
         })
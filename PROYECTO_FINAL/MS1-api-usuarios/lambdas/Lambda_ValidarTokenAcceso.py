@@ -1,7 +1,8 @@
-import boto3
-from datetime import datetime
+import time
 import json
 import os  # para leer variables de entorno
+from utils.recursos_aws import obtener_tabla
+from utils.tokens import TokenInvalido, es_token_firmado, expires_epoch, tokens_firmados_activos, verificar_token
 
 # Headers CORS para todas las respuestas
 cors_headers = {
@@ -42,10 +43,30 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Token no proporcionado'})
             }
 
+        # Tokens firmados: se verifican sin leer DynamoDB
+        if tokens_firmados_activos() and es_token_firmado(token):
+            try:
+                payload = verificar_token(token)
+            except TokenInvalido as e:
+                return {
+                    'statusCode': 403,
+                    'headers': cors_headers,
+                    'body': json.dumps({'error': str(e)})
+                }
+
+            return {
+                'statusCode': 200,
+                'headers': cors_headers,
+                'body': json.dumps({
+                    'message': 'Token válido',
+                    'tenant_id': payload.get('tenant_id'),
+                    'user_id': payload.get('user_id')
+                })
+            }
+
         # Consultar DynamoDB
-        dynamodb = boto3.resource('dynamodb')
         tokens_table_name = os.environ['TOKENS_TABLE']
-        table = dynamodb.Table(tokens_table_name)
+        table = obtener_tabla(tokens_table_name)
         response = table.get_item(Key={'token': token})
 
         print("Respuesta de DynamoDB:", response)
@@ -57,10 +78,9 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Token no existe'})
             }
 
-        expires = response['Item']['expires']
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        expires = expires_epoch(response['Item']['expires'])
 
-        if now > expires:
+        if time.time() > expires:
             return {
                 'statusCode': 403,
                 'headers': cors_headers,
@@ -0,0 +1,122 @@
+import time
+import json
+import os  # para leer variables de entorno
+from utils.recursos_aws import obtener_dynamodb
+from utils.tokens import TokenInvalido, es_token_firmado, expires_epoch, tokens_firmados_activos, verificar_token
+
+# Headers CORS para todas las respuestas
+cors_headers = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS'
+}
+
+MAX_TOKENS = 100           # límite de batch_get_item por llamada
+MAX_REINTENTOS = 5         # reintentos para UnprocessedKeys
+
+def leer_tokens(dynamodb, table_name, tokens):
+    # batch_get_item con reintentos (backoff exponencial) sobre las claves no procesadas
+    items = {}
+    pendientes = {table_name: {'Keys': [{'token': t} for t in tokens]}}
+    for intento in range(MAX_REINTENTOS + 1):
+        respuesta = dynamodb.batch_get_item(RequestItems=pendientes)
+        for item in respuesta.get('Responses', {}).get(table_name, []):
+            items[item['token']] = item
+
+        pendientes = respuesta.get('UnprocessedKeys') or {}
+        if not pendientes:
+            return items
+        if intento < MAX_REINTENTOS:
+            time.sleep(0.05 * (2 ** intento))
+
+    raise Exception('No se pudieron leer todos los tokens (UnprocessedKeys)')
+
+def lambda_handler(event, context):
+    print("Evento recibido:", event)
+
+    # Manejar requests OPTIONS para CORS preflight
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps({'message': 'CORS preflight'})
+        }
+
+    try:
+        # Verificar que el body no sea None
+        if not event.get('body'):
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': 'Cuerpo del request vacío'})
+            }
+
+        body = json.loads(event['body'])
+        tokens = body.get('tokens')
+
+        if not isinstance(tokens, list) or not tokens or not all(isinstance(t, str) and t for t in tokens):
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': 'tokens debe ser una lista no vacía de strings'})
+            }
+
+        if len(tokens) > MAX_TOKENS:
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': f'Máximo {MAX_TOKENS} tokens por request'})
+            }
+
+        resultados = {}
+
+        # Tokens firmados: se verifican sin leer DynamoDB
+        por_consultar = []
+        for token in dict.fromkeys(tokens):
+            if tokens_firmados_activos() and es_token_firmado(token):
+                try:
+                    payload = verificar_token(token)
+                    resultados[token] = {
+                        'status': 'valido',
+                        'tenant_id': payload.get('tenant_id'),
+                        'user_id': payload.get('user_id')
+                    }
+                except TokenInvalido as e:
+                    resultados[token] = {'status': 'invalido', 'error': str(e)}
+            else:
+                por_consultar.append(token)
+
+        if por_consultar:
+            # Consultar DynamoDB en una sola llamada batch (claves sin duplicados)
+            items = leer_tokens(obtener_dynamodb(), os.environ['TOKENS_TABLE'], por_consultar)
+            now = time.time()
+
+            for token in por_consultar:
+                item = items.get(token)
+                if not item:
+                    resultados[token] = {'status': 'no_existe'}
+                elif now > expires_epoch(item['expires']):
+                    resultados[token] = {'status': 'expirado'}
+                else:
+                    resultados[token] = {
+                        'status': 'valido',
+                        'tenant_id': item.get('tenant_id'),
+                        'user_id': item.get('user_id')
+                    }
+
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps({
+                'resultados': [dict(resultados[token], token=token) for token in tokens]
+            })
+        }
+
+    except Exception as e:
+        print("ERROR:", str(e))
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
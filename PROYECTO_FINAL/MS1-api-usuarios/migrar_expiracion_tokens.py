@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Migración única de la tabla de tokens al formato de expiración numérico
+
+Recorre la tabla con un scan paralelo (un segmento por hilo) y para cada token:
+- si ya expiró, lo elimina
+- si 'expires' sigue siendo string '%Y-%m-%d %H:%M:%S', lo convierte a segundos epoch
+  para que el TTL de DynamoDB pueda reaparlo
+
+Uso:
+    python migrar_expiracion_tokens.py --tabla dev-t_MS1_tokens_acceso --segmentos 8 [--dry-run]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+from utils.tokens import expires_epoch
+
+
+def procesar_segmento(tabla, segmento, total_segmentos, ahora, dry_run):
+    """Procesa un segmento del scan paralelo y devuelve sus contadores"""
+    resumen = {'revisados': 0, 'convertidos': 0, 'eliminados': 0, 'omitidos': 0}
+    kwargs = {
+        'Segment': segmento,
+        'TotalSegments': total_segmentos,
+        'ProjectionExpression': '#t, #e',
+        'ExpressionAttributeNames': {'#t': 'token', '#e': 'expires'}
+    }
+
+    while True:
+        respuesta = tabla.scan(**kwargs)
+        for item in respuesta.get('Items', []):
+            resumen['revisados'] += 1
+            expires = expires_epoch(item['expires'])
+
+            if expires < ahora:
+                resumen['eliminados'] += 1
+                if not dry_run:
+                    tabla.delete_item(Key={'token': item['token']})
+            elif isinstance(item['expires'], str):
+                if not dry_run:
+                    # Condición: no pisar un login que haya reescrito o borrado el token mientras tanto
+                    try:
+                        tabla.update_item(
+                            Key={'token': item['token']},
+                            UpdateExpression='SET #e = :nuevo',
+                            ConditionExpression='#e = :anterior',
+                            ExpressionAttributeNames={'#e': 'expires'},
+                            ExpressionAttributeValues={':nuevo': expires, ':anterior': item['expires']}
+                        )
+                    except ClientError as e:
+                        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                            raise
+                        resumen['omitidos'] += 1
+                        continue
+                resumen['convertidos'] += 1
+
+        if 'LastEvaluatedKey' not in respuesta:
+            return resumen
+        kwargs['ExclusiveStartKey'] = respuesta['LastEvaluatedKey']
+
+
+def migrar(tabla, total_segmentos=4, dry_run=False):
+    """Ejecuta el scan paralelo sobre la tabla y agrega los contadores de cada segmento"""
+    ahora = int(time.time())
+    with ThreadPoolExecutor(max_workers=total_segmentos) as pool:
+        resultados = list(pool.map(
+            lambda segmento: procesar_segmento(tabla, segmento, total_segmentos, ahora, dry_run),
+            range(total_segmentos)
+        ))
+
+    total = {'revisados': 0, 'convertidos': 0, 'eliminados': 0, 'omitidos': 0}
+    for resumen in resultados:
+        for clave, valor in resumen.items():
+            total[clave] += valor
+    return total
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Migra expires de la tabla de tokens a segundos epoch')
+    parser.add_argument('--tabla', default='dev-t_MS1_tokens_acceso')
+    parser.add_argument('--segmentos', type=int, default=4)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    print(f"🚀 Migrando {args.tabla} con {args.segmentos} segmentos{' (dry-run)' if args.dry_run else ''}")
+    tabla = boto3.resource('dynamodb').Table(args.tabla)
+    total = migrar(tabla, args.segmentos, args.dry_run)
+    print(f"✅ Revisados: {total['revisados']} | Convertidos: {total['convertidos']} | Eliminados: {total['eliminados']} | Omitidos (cambiaron durante la migración): {total['omitidos']}")
+
+
+if __name__ == "__main__":
+    main()
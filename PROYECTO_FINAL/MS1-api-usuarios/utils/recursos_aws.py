@@ -0,0 +1,45 @@
+"""
+Recursos AWS compartidos por las lambdas de MS1
+
+El recurso DynamoDB y las tablas se construyen una sola vez por contenedor
+(de forma perezosa, en la primera invocación) y se reutilizan en las
+invocaciones en caliente, conservando el pool de conexiones HTTP.
+
+Variables de entorno:
+    DYNAMODB_MAX_POOL: conexiones máximas del pool (por defecto 10)
+    DYNAMODB_TCP_KEEPALIVE: 'true' para activar TCP keep-alive (por defecto)
+    DYNAMODB_ENDPOINT: endpoint alternativo (DynamoDB Local en pruebas)
+"""
+
+import os
+
+import boto3
+from botocore.config import Config
+
+_dynamodb = None
+_tablas = {}
+
+
+def obtener_dynamodb():
+    """Devuelve el recurso DynamoDB del contenedor, creándolo la primera vez"""
+    global _dynamodb
+    if _dynamodb is None:
+        config = Config(
+            max_pool_connections=int(os.environ.get('DYNAMODB_MAX_POOL', '10')),
+            tcp_keepalive=os.environ.get('DYNAMODB_TCP_KEEPALIVE', 'true').lower() == 'true'
+        )
+        _dynamodb = boto3.resource(
+            'dynamodb',
+            config=config,
+            endpoint_url=os.environ.get('DYNAMODB_ENDPOINT') or None
+        )
+    return _dynamodb
+
+
+def obtener_tabla(nombre: str):
+    """Devuelve (y memoriza) el objeto Table para el nombre indicado"""
+    tabla = _tablas.get(nombre)
+    if tabla is None:
+        tabla = obtener_dynamodb().Table(nombre)
+        _tablas[nombre] = tabla
+    return tabla
@@ -0,0 +1,121 @@
+"""
+Tokens de acceso firmados (HMAC-SHA256, formato compatible con JWT HS256)
+
+Cuando TOKEN_MODE=firmado el login emite tokens que llevan user_id, tenant_id
+y la expiración (epoch en segundos) firmados con JWT_SECRET, de modo que los
+validadores pueden verificarlos sin leer la tabla de tokens.
+
+Mismo módulo que MS3-api-compras/utils/tokens.py (cada servicio se empaqueta
+por separado): los cambios de formato se hacen en ambos. MS2 lo implementa en
+middleware/validarToken.js.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+TOKEN_MODE_FIRMADO = 'firmado'
+
+# Vigencia de los tokens emitidos por el login
+TOKEN_DURACION_SEGUNDOS = 60 * 60
+
+_HEADER = {'alg': 'HS256', 'typ': 'JWT'}
+
+
+class TokenInvalido(Exception):
+    """Token firmado mal formado, con firma incorrecta o expirado"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _firma(mensaje: str, secret: str) -> str:
+    return _b64encode(hmac.new(secret.encode(), mensaje.encode(), hashlib.sha256).digest())
+
+
+def expires_epoch(valor) -> int:
+    """
+    Normaliza el atributo 'expires' de la tabla de tokens a segundos epoch.
+    Acepta el formato numérico actual y el string '%Y-%m-%d %H:%M:%S' (UTC)
+    que guardaban las versiones anteriores del login.
+    """
+    if isinstance(valor, str):
+        fecha = datetime.strptime(valor, '%Y-%m-%d %H:%M:%S')
+        return int(fecha.replace(tzinfo=timezone.utc).timestamp())
+    return int(valor)
+
+
+def tokens_firmados_activos() -> bool:
+    return os.environ.get('TOKEN_MODE', 'dynamodb') == TOKEN_MODE_FIRMADO
+
+
+def es_token_firmado(token: str) -> bool:
+    # Los tokens clásicos son uuid4 (sin puntos); los firmados tienen 3 segmentos
+    return token.count('.') == 2
+
+
+def firmar_token(user_id: str, tenant_id: str, expires: int, secret: str = None) -> str:
+    """
+    Genera un token firmado
+
+    Args:
+        user_id: Usuario autenticado
+        tenant_id: Tenant del usuario
+        expires: Expiración en segundos epoch
+
+    Returns:
+        Token en formato header.payload.firma
+    """
+    secret = secret or os.environ['JWT_SECRET']
+    payload = {'user_id': user_id, 'tenant_id': tenant_id, 'exp': int(expires)}
+    mensaje = '.'.join([
+        _b64encode(json.dumps(_HEADER, separators=(',', ':')).encode()),
+        _b64encode(json.dumps(payload, separators=(',', ':')).encode())
+    ])
+    return f"{mensaje}.{_firma(mensaje, secret)}"
+
+
+def verificar_token(token: str, secret: str = None, now: float = None) -> dict:
+    """
+    Verifica firma y expiración de un token firmado sin acceder a DynamoDB
+
+    Returns:
+        Payload con user_id, tenant_id y exp
+
+    Raises:
+        TokenInvalido: si el token no es válido o ya expiró
+    """
+    secret = secret or os.environ['JWT_SECRET']
+    try:
+        header_b64, payload_b64, firma = token.split('.')
+        header = json.loads(_b64decode(header_b64))
+        payload = json.loads(_b64decode(payload_b64))
+    except (ValueError, TypeError, AttributeError):
+        raise TokenInvalido('Token mal formado')
+
+    # JSON válido pero no objeto (p. ej. "[]")
+    if not isinstance(header, dict) or not isinstance(payload, dict) or header.get('alg') != _HEADER['alg']:
+        raise TokenInvalido('Token mal formado')
+
+    # Se comparan bytes: compare_digest rechaza str no ASCII con TypeError
+    esperada = _firma(f"{header_b64}.{payload_b64}", secret).encode()
+    if not hmac.compare_digest(firma.encode('utf-8'), esperada):
+        raise TokenInvalido('Firma inválida')
+
+    if not isinstance(payload.get('user_id'), str) or not isinstance(payload.get('tenant_id'), str):
+        raise TokenInvalido('Token mal formado')
+
+    now = time.time() if now is None else now
+    if not isinstance(payload.get('exp'), int) or now > payload['exp']:
+        raise TokenInvalido('Token expirado')
+
+    return payload
@@ -3,7 +3,7 @@ import { DynamoDBClient } from "@aws-sdk/client-dynamodb";
 import {
   DynamoDBDocumentClient,
   GetCommand,
-  PutCommand,
+  UpdateCommand,
 } from "@aws-sdk/lib-dynamodb";
 import { validarToken } from "../middleware/validarToken.js";
 
@@ -105,23 +105,75 @@ export const modificarProducto = async (event) => {
       };
     }
 
-    // Construir producto actualizado
-    const productoActualizado = {
-      ...existingProduct.Item,
+    // Productos con stock por shards (ventas flash de MS3): 'cantidad' es la vista
+    // agregada que publica el rebalanceo y lo sobrescribiría. La reposición se hace
+    // sobre los shards (MS3-api-compras/habilitar_stock_shards.py --reponer)
+    if (cantidad !== undefined && existingProduct.Item.shards) {
+      return {
+        statusCode: 409,
+        headers: corsHeaders,
+        body: JSON.stringify({
+          mensaje: "El stock de este producto está repartido en shards; la cantidad no se modifica desde MS2",
+        }),
+      };
+    }
+
+    // Solo se escriben los campos enviados: un put del item completo pisaría
+    // los descuentos de stock que MS3 hace entre la lectura y la escritura
+    const cambios = {
       ...(nombre && { nombre }),
       ...(descripcion !== undefined && { descripcion }),
       ...(precio && { precio: parseFloat(precio) }),
       ...(cantidad !== undefined && { cantidad: parseInt(cantidad) }),
       fechaModificacion: new Date().toISOString(),
     };
+    const names = { "#version": "version" };
+    const values = { ":uno": 1 };
+    const sets = Object.entries(cambios).map(([campo, valor]) => {
+      names[`#${campo}`] = campo;
+      values[`:${campo}`] = valor;
+      return `#${campo} = :${campo}`;
+    });
+
+    // MS3 cachea nombre/precio y verifica esta versión al registrar compras.
+    // La condición sobre la versión leída detecta otra modificación concurrente
+    const versionLeida = existingProduct.Item.version;
+    let condicion = "attribute_not_exists(#version)";
+    if (versionLeida !== undefined) {
+      condicion = "#version = :versionLeida";
+      values[":versionLeida"] = versionLeida;
+    }
+    if (cantidad !== undefined) {
+      // El producto pudo pasar a shards después de la lectura
+      condicion += " AND attribute_not_exists(shards)";
+    }
 
-    // Usar AWS SDK v3 command pattern para actualizar
-    const putCommand = new PutCommand({
+    const updateCommand = new UpdateCommand({
       TableName: tableName,
-      Item: productoActualizado,
+      Key: { codigo },
+      UpdateExpression: `SET ${sets.join(", ")}, #version = if_not_exists(#version, :cero) + :uno`,
+      ConditionExpression: condicion,
+      ExpressionAttributeNames: names,
+      ExpressionAttributeValues: { ...values, ":cero": 0 },
+      ReturnValues: "ALL_NEW",
     });
 
-    await docClient.send(putCommand);
+    let productoActualizado;
+    try {
+      const resultado = await docClient.send(updateCommand);
+      productoActualizado = resultado.Attributes;
+    } catch (error) {
+      if (error.name !== "ConditionalCheckFailedException") {
+        throw error;
+      }
+      return {
+        statusCode: 409,
+        headers: corsHeaders,
+        body: JSON.stringify({
+          mensaje: "El producto fue modificado por otra operación; vuelve a leerlo y reintenta",
+        }),
+      };
+    }
 
     return {
       statusCode: 200,
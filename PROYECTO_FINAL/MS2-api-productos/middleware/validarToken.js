@@ -1,11 +1,57 @@
 // Usando AWS SDK v3 - Compatible con el resto del proyecto
 import { DynamoDBClient } from "@aws-sdk/client-dynamodb";
 import { DynamoDBDocumentClient, GetCommand } from "@aws-sdk/lib-dynamodb";
+import { createHmac, timingSafeEqual } from "crypto";
 
 const dynamoClient = new DynamoDBClient();
 const docClient = DynamoDBDocumentClient.from(dynamoClient);
 
+const rechazo = (statusCode, mensaje) => ({
+  ok: false,
+  respuesta: {
+    statusCode,
+    body: JSON.stringify({ mensaje })
+  }
+});
+
+// Tokens firmados por MS1 con TOKEN_MODE=firmado (HS256 con JWT_SECRET, ver
+// MS1-api-usuarios/utils/tokens.py): se verifican sin leer la tabla de tokens
+const verificarTokenFirmado = (token) => {
+  const [headerB64, payloadB64, firma] = token.split('.');
+  let header;
+  let payload;
+  try {
+    header = JSON.parse(Buffer.from(headerB64, 'base64url').toString());
+    payload = JSON.parse(Buffer.from(payloadB64, 'base64url').toString());
+  } catch (err) {
+    return { error: 'Token mal formado' };
+  }
+
+  if (!header || header.alg !== 'HS256' || !payload || typeof payload.user_id !== 'string' || typeof payload.tenant_id !== 'string') {
+    return { error: 'Token mal formado' };
+  }
+
+  const esperada = createHmac('sha256', process.env.JWT_SECRET)
+    .update(`${headerB64}.${payloadB64}`)
+    .digest('base64url');
+  const a = Buffer.from(firma);
+  const b = Buffer.from(esperada);
+  if (a.length !== b.length || !timingSafeEqual(a, b)) {
+    return { error: 'Firma inválida' };
+  }
+
+  if (!Number.isInteger(payload.exp) || Date.now() / 1000 > payload.exp) {
+    return { error: 'Token expirado' };
+  }
+
+  return { payload };
+};
+
 export const validarToken = async (headers) => {
+  if (!headers || typeof headers !== 'object') {
+    return rechazo(403, 'Headers inválidos');
+  }
+
   let token = headers['x-auth-token'] || headers['authorization'] || headers['Authorization'];
 
   if (!token) {
@@ -19,10 +65,30 @@ export const validarToken = async (headers) => {
   }
 
   // Remover prefijo "Bearer " si lo tiene
+  if (typeof token !== 'string') {
+    return rechazo(403, 'Token mal formado');
+  }
   if (token.startsWith('Bearer ')) {
     token = token.slice(7);
   }
 
+  // Modo firmado: validación offline, igual que MS3
+  if ((process.env.TOKEN_MODE || 'dynamodb') === 'firmado' && token.split('.').length === 3) {
+    const { payload, error } = verificarTokenFirmado(token);
+    if (error) {
+      return rechazo(403, error);
+    }
+    return {
+      ok: true,
+      datos: {
+        token,
+        user_id: payload.user_id,
+        tenant_id: payload.tenant_id,
+        expires: payload.exp
+      }
+    };
+  }
+
   try {
     const tableName = process.env.TOKENS_TABLE;
 
@@ -43,8 +109,11 @@ export const validarToken = async (headers) => {
       };
     }
 
-    const now = new Date().toISOString().replace('T', ' ').substring(0, 19);
-    if (now > res.Item.expires) {
+    // 'expires' es numérico (segundos epoch); los tokens antiguos lo guardaban como string UTC
+    const expires = typeof res.Item.expires === 'number'
+      ? res.Item.expires
+      : Date.parse(res.Item.expires.replace(' ', 'T') + 'Z') / 1000;
+    if (Date.now() / 1000 > expires) {
       return {
         ok: false,
         respuesta: {
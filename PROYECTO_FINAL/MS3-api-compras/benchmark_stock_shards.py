@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark de contención: stock en un único item vs stock por shards
+
+Lanza compras concurrentes de un mismo producto contra DynamoDB Local y mide
+throughput y cancelaciones de transacción en ambos modos:
+- unico: TransactWriteItems con el descuento condicional sobre el producto
+- shards: el mismo descuento repartido al azar entre N shards
+
+    docker run -p 8000:8000 amazon/dynamodb-local
+    python benchmark_stock_shards.py --endpoint http://localhost:8000 --hilos 16 --compras 50 --shards 10
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+from utils.stock_shards import elegir_shards, habilitar_sharding, leer_shards, operaciones_descuento
+
+CODIGO = 'BENCH-FLASH'
+CREDENCIALES_LOCALES = {
+    'region_name': 'us-east-1',
+    'aws_access_key_id': 'local',
+    'aws_secret_access_key': 'local'
+}
+
+
+def crear_tablas(dynamodb):
+    """Crea (o recrea) las tablas de productos y shards de prueba"""
+    definiciones = {
+        'bench-t_MS2_productos': [('codigo', 'S', 'HASH')],
+        'bench-t_MS3_stock_shards': [('shard_id', 'S', 'HASH')]
+    }
+    existentes = [t.name for t in dynamodb.tables.all()]
+    tablas = []
+    for nombre, claves in definiciones.items():
+        if nombre in existentes:
+            dynamodb.Table(nombre).delete()
+            dynamodb.Table(nombre).wait_until_not_exists()
+        tabla = dynamodb.create_table(
+            TableName=nombre,
+            AttributeDefinitions=[{'AttributeName': a, 'AttributeType': t} for a, t, _ in claves],
+            KeySchema=[{'AttributeName': a, 'KeyType': k} for a, _, k in claves],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        tabla.wait_until_exists()
+        tablas.append(tabla)
+    return tablas
+
+
+def comprar(dynamodb, productos_table, shards_table, modo, n):
+    """Una compra de 1 unidad con reintentos; devuelve cuántas veces se canceló"""
+    cancelaciones = 0
+    while True:
+        if modo == 'shards':
+            asignacion = elegir_shards(leer_shards(shards_table, CODIGO, n), 1)
+            operaciones = operaciones_descuento(shards_table.name, CODIGO, asignacion)
+        else:
+            operaciones = [{
+                'Update': {
+                    'TableName': productos_table.name,
+                    'Key': {'codigo': {'S': CODIGO}},
+                    'UpdateExpression': 'SET cantidad = cantidad - :c',
+                    'ConditionExpression': 'cantidad >= :c',
+                    'ExpressionAttributeValues': {':c': {'N': '1'}}
+                }
+            }]
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=operaciones)
+            return cancelaciones
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            cancelaciones += 1
+
+
+def ejecutar(modo, args):
+    dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint, **CREDENCIALES_LOCALES)
+    productos_table, shards_table = crear_tablas(dynamodb)
+    total = args.hilos * args.compras
+    productos_table.put_item(Item={'codigo': CODIGO, 'nombre': 'Flash', 'precio': 1, 'cantidad': total * 2})
+    if modo == 'shards':
+        habilitar_sharding(dynamodb, productos_table, shards_table, CODIGO, args.shards)
+
+    def hilo(_):
+        return sum(comprar(dynamodb, productos_table, shards_table, modo, args.shards) for _ in range(args.compras))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        cancelaciones = sum(pool.map(hilo, range(args.hilos)))
+    duracion = time.perf_counter() - inicio
+
+    print(f"{modo:7} compras={total}  {total / duracion:8.1f} compras/s  cancelaciones={cancelaciones}")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de contención del stock por shards')
+    parser.add_argument('--endpoint', default='http://localhost:8000')
+    parser.add_argument('--hilos', type=int, default=16)
+    parser.add_argument('--compras', type=int, default=50, help='compras por hilo')
+    parser.add_argument('--shards', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"🚀 {args.hilos} hilos x {args.compras} compras contra {args.endpoint}")
+    ejecutar('unico', args)
+    ejecutar('shards', args)
+
+
+if __name__ == "__main__":
+    main()
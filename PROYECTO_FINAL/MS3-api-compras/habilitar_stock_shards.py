@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Activa el inventario por shards para un producto (ventas flash)
+
+Reparte la 'cantidad' actual del producto en N shards de la tabla de stock y
+marca el producto con 'shards' = N. A partir de ese momento registrar_compra
+descuenta de los shards y el rebalanceo periódico publica el total agregado.
+
+Con --reponer suma unidades a un producto ya sharded (MS2 no acepta cambios
+de 'cantidad' en esos productos). Con --migrar-desde copia los shards de la
+tabla anterior (clave codigo + shard) al formato actual (shard_id) y registra
+esos productos para el rebalanceo. Con --reconstruir-registro escanea una vez
+t_MS2_productos y registra los productos que ya tienen 'shards'.
+
+Uso:
+    python habilitar_stock_shards.py --codigo PROD-001 --shards 10 --stage dev
+    python habilitar_stock_shards.py --codigo PROD-001 --reponer 500 --stage dev
+    python habilitar_stock_shards.py --migrar-desde dev-t_MS3_stock_shards --stage dev
+    python habilitar_stock_shards.py --reconstruir-registro --stage dev
+"""
+
+import argparse
+
+import boto3
+
+from utils.stock_shards import clave_shard, es_sharded, habilitar_sharding, registrar_sharded, reponer
+
+
+def migrar(dynamodb, origen, destino):
+    """Copia los shards de la tabla con clave codigo + shard a la de clave shard_id"""
+    copiados = 0
+    codigos = set()
+    kwargs = {}
+    with destino.batch_writer() as batch:
+        while True:
+            respuesta = dynamodb.Table(origen).scan(**kwargs)
+            for item in respuesta.get('Items', []):
+                batch.put_item(Item=dict(item, shard_id=clave_shard(item['codigo'], int(item['shard']))))
+                codigos.add(item['codigo'])
+                copiados += 1
+            if 'LastEvaluatedKey' not in respuesta:
+                break
+            kwargs['ExclusiveStartKey'] = respuesta['LastEvaluatedKey']
+    registrar_sharded(destino, codigos)
+    return copiados
+
+
+def reconstruir_registro(productos_table, shards_table):
+    """Registra los productos sharded existentes (un solo scan de t_MS2_productos)"""
+    codigos = set()
+    kwargs = {'FilterExpression': 'attribute_exists(shards)', 'ProjectionExpression': 'codigo, shards'}
+    while True:
+        respuesta = productos_table.scan(**kwargs)
+        codigos.update(p['codigo'] for p in respuesta.get('Items', []) if es_sharded(p))
+        if 'LastEvaluatedKey' not in respuesta:
+            break
+        kwargs['ExclusiveStartKey'] = respuesta['LastEvaluatedKey']
+    registrar_sharded(shards_table, codigos)
+    return len(codigos)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Activa stock por shards para un producto')
+    parser.add_argument('--codigo')
+    parser.add_argument('--shards', type=int, default=10)
+    parser.add_argument('--reponer', type=int, help='unidades a sumar a un producto sharded')
+    parser.add_argument('--migrar-desde', help='tabla de shards anterior a copiar')
+    parser.add_argument('--reconstruir-registro', action='store_true',
+                        help='registra los productos que ya tienen shards')
+    parser.add_argument('--stage', default='dev')
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource('dynamodb')
+    productos_table = dynamodb.Table(f'{args.stage}-t_MS2_productos')
+    shards_table = dynamodb.Table(f'{args.stage}-t_MS3_stock_shards_v2')
+
+    if args.migrar_desde:
+        copiados = migrar(dynamodb, args.migrar_desde, shards_table)
+        print(f"✅ {copiados} shards copiados desde {args.migrar_desde}")
+        return
+
+    if args.reconstruir_registro:
+        registrados = reconstruir_registro(productos_table, shards_table)
+        print(f"✅ {registrados} productos sharded registrados para el rebalanceo")
+        return
+
+    if not args.codigo:
+        parser.error('--codigo es requerido')
+
+    if args.reponer is not None:
+        producto = productos_table.get_item(Key={'codigo': args.codigo}, ConsistentRead=True)['Item']
+        if not es_sharded(producto):
+            parser.error(f'El producto {args.codigo} no tiene stock por shards; se repone desde MS2')
+        reponer(shards_table, args.codigo, int(producto['shards']), args.reponer)
+        print(f"✅ {args.reponer} unidades sumadas a {args.codigo}; el rebalanceo actualiza el total")
+        return
+
+    habilitar_sharding(dynamodb, productos_table, shards_table, args.codigo, args.shards)
+    print(f"✅ Producto {args.codigo} repartido en {args.shards} shards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import boto3
+import os
+from boto3.dynamodb.types import TypeDeserializer
+from utils.resumen_usuario import aplicar_compra
+
+# Consumidor del stream de la tabla de compras: mantiene los agregados por usuario
+
+dynamodb = boto3.resource('dynamodb')
+resumen_table = dynamodb.Table(os.environ['RESUMEN_USUARIOS_TABLE'])
+eventos_table = dynamodb.Table(os.environ['IDEMPOTENCIA_TABLE'])
+deserializer = TypeDeserializer()
+
+def lambda_handler(event, context):
+    resultado = {'aplicados': 0, 'duplicados': 0, 'ignorados': 0}
+
+    for record in event.get('Records', []):
+        # Solo las altas suman: las MODIFY (migraciones) y REMOVE (expiración) no cambian el histórico
+        if record.get('eventName') != 'INSERT':
+            resultado['ignorados'] += 1
+            continue
+
+        imagen = record['dynamodb']['NewImage']
+        compra = {k: deserializer.deserialize(v) for k, v in imagen.items()}
+        if aplicar_compra(dynamodb, resumen_table, eventos_table, compra):
+            resultado['aplicados'] += 1
+        else:
+            print(f"Evento {record['eventID']} ya aplicado (compra {compra.get('compra_id')})")
+            resultado['duplicados'] += 1
+
+    print("Resumen agregados:", resultado)
+    return resultado
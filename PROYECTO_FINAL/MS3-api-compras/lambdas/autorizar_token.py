@@ -0,0 +1,49 @@
+import json
+from middleware.validarTokenAcceso import validar_token
+
+# Autorizador REQUEST de API Gateway. identitySource es el header Authorization
+# y API Gateway cachea el resultado por su valor (resultTtlInSeconds: 60); en un
+# cache miss la lectura de la tabla de tokens la evita el cache en memoria de
+# validarTokenAcceso (TOKEN_CACHE_TTL, acotado al expires del token). La política
+# se genera para todo el API (stage/*/*) porque se reutiliza en cualquier ruta.
+
+def generar_politica(principal_id, efecto, method_arn, contexto=None):
+    api_arn, stage = method_arn.split('/')[:2]
+    politica = {
+        'principalId': principal_id,
+        'policyDocument': {
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Action': 'execute-api:Invoke',
+                'Effect': efecto,
+                'Resource': f'{api_arn}/{stage}/*/*'
+            }]
+        }
+    }
+    if contexto:
+        politica['context'] = contexto
+    return politica
+
+def autorizar(event, table=None):
+    token_validacion = validar_token(event.get('headers') or {}, table=table)
+
+    if not token_validacion['ok']:
+        status = token_validacion['respuesta']['statusCode']
+        print("Token rechazado:", token_validacion['respuesta']['body'])
+        if status == 401:
+            # Sin token: API Gateway responde 401
+            raise Exception('Unauthorized')
+        if status == 500:
+            # Error al consultar DynamoDB: no cachear una denegación
+            raise Exception(json.loads(token_validacion['respuesta']['body'])['mensaje'])
+        return generar_politica('anonimo', 'Deny', event['methodArn'])
+
+    datos = token_validacion['datos']
+    return generar_politica(datos['user_id'], 'Allow', event['methodArn'], {
+        'user_id': datos['user_id'],
+        'tenant_id': datos['tenant_id']
+    })
+
+def lambda_handler(event, context):
+    print("Evento recibido:", event.get('methodArn'))
+    return autorizar(event)
@@ -0,0 +1,65 @@
+import boto3
+import json
+import os
+from middleware.validarTokenAcceso import obtener_datos_token
+
+# Headers CORS para todas las respuestas
+cors_headers = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS'
+}
+
+estado_table = boto3.resource('dynamodb').Table(os.environ['COMPRAS_ESTADO_TABLE'])
+
+def lambda_handler(event, context):
+    print("Evento recibido:", event)
+
+    # Manejar requests OPTIONS para CORS preflight
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps({'message': 'CORS preflight'})
+        }
+
+    # Validar el token
+    token_validacion = obtener_datos_token(event)
+    if not token_validacion['ok']:
+        # Agregar headers CORS a la respuesta de error
+        error_response = token_validacion['respuesta']
+        error_response['headers'] = cors_headers
+        return error_response
+
+    datos_token = token_validacion['datos']
+    compra_id = (event.get('pathParameters') or {}).get('compra_id')
+
+    try:
+        item = estado_table.get_item(Key={'compra_id': compra_id}).get('Item') if compra_id else None
+
+        # Solo el dueño de la compra puede consultar su estado
+        if not item or item.get('tenant_user') != f"{datos_token['tenant_id']}#{datos_token['user_id']}":
+            return {
+                'statusCode': 404,
+                'headers': cors_headers,
+                'body': json.dumps({'error': 'Compra no encontrada'})
+            }
+
+        respuesta = {'compra_id': compra_id, 'estado': item['estado']}
+        if item.get('error'):
+            respuesta['error'] = item['error']
+
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps(respuesta)
+        }
+
+    except Exception as e:
+        print("ERROR:", str(e))
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -0,0 +1,97 @@
+import boto3
+import json
+import os
+import uuid
+from boto3.dynamodb.conditions import Key
+from middleware.validarTokenAcceso import obtener_datos_token
+from lambdas.listar_compras import INDICE_USUARIO, DecimalEncoder
+from utils import archivo_compras
+from utils.compresion import responder
+from utils.exportacion_s3 import CONTENT_TYPE, ExportacionNDJSON
+
+# Headers CORS para todas las respuestas
+cors_headers = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS'
+}
+
+compras_table = boto3.resource('dynamodb').Table(os.environ['COMPRAS_TABLE'])
+s3_client = boto3.client('s3')
+
+def compras_del_usuario(datos_token):
+    # Recorre el historial página a página (más recientes primero) sin acumularlo
+    kwargs = {
+        'IndexName': INDICE_USUARIO,
+        'KeyConditionExpression': Key('tenant_user').eq(f"{datos_token['tenant_id']}#{datos_token['user_id']}"),
+        'ScanIndexForward': False
+    }
+    while True:
+        resultado = compras_table.query(**kwargs)
+        yield from resultado.get('Items', [])
+        if 'LastEvaluatedKey' not in resultado:
+            break
+        kwargs['ExclusiveStartKey'] = resultado['LastEvaluatedKey']
+
+    # Después, las compras que el TTL ya pasó al archivo frío
+    if not archivo_compras.COMPRAS_ARCHIVO_BUCKET:
+        return
+    prefijo = archivo_compras.prefijo_usuario(datos_token['tenant_id'], datos_token['user_id'])
+    start_after = None
+    while True:
+        claves, hay_mas = archivo_compras.listar_claves(s3_client, prefijo, start_after, archivo_compras.LECTURAS_PARALELAS * 4)
+        yield from archivo_compras.leer_compras(s3_client, claves)
+        if not hay_mas:
+            return
+        start_after = claves[-1]
+
+def lambda_handler(event, context):
+    print("Evento recibido:", event)
+
+    # Manejar requests OPTIONS para CORS preflight
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps({'message': 'CORS preflight'})
+        }
+
+    # Validar el token
+    token_validacion = obtener_datos_token(event)
+    if not token_validacion['ok']:
+        # Agregar headers CORS a la respuesta de error
+        error_response = token_validacion['respuesta']
+        error_response['headers'] = cors_headers
+        return error_response
+
+    datos_token = token_validacion['datos']
+    key = f"exportes/{datos_token['tenant_id']}/{datos_token['user_id']}/{uuid.uuid4()}.ndjson"
+    exportacion = ExportacionNDJSON(s3_client, os.environ['EXPORTES_BUCKET'], key)
+
+    try:
+        for compra in compras_del_usuario(datos_token):
+            compra.pop('tenant_user', None)
+            compra.pop('archivar_en', None)
+            exportacion.escribir(json.dumps(compra, cls=DecimalEncoder, ensure_ascii=False))
+
+        resultado = exportacion.cerrar()
+        if 'ndjson' in resultado:
+            # Historial chico: NDJSON en el mismo response
+            return responder(event, 200, dict(cors_headers, **{'Content-Type': CONTENT_TYPE}), resultado['ndjson'])
+
+        print(f"Export de {exportacion.lineas} compras en s3://{os.environ['EXPORTES_BUCKET']}/{key}")
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps(dict(resultado, compras=exportacion.lineas, formato=CONTENT_TYPE))
+        }
+
+    except Exception as e:
+        print("ERROR:", str(e))
+        exportacion.abortar()
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
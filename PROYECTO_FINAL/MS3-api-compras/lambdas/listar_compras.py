@@ -1,17 +1,33 @@
 import boto3
 import json
 import os
+import base64
 import decimal
-from middleware.validarTokenAcceso import validar_token
+import hashlib
+from boto3.dynamodb.conditions import Key
+from middleware.validarTokenAcceso import obtener_datos_token
+from utils.compresion import obtener_header, responder
+from utils import archivo_compras
 
 # Headers CORS para todas las respuestas
 cors_headers = {
     'Content-Type': 'application/json',
     'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-    'Access-Control-Allow-Methods': 'GET, OPTIONS'
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Expose-Headers': 'X-Next-Token,ETag'
 }
 
+# Índice por tenant_id#user_id ordenado por fecha
+INDICE_USUARIO = 'tenant_user-fecha-index'
+MAX_LIMIT = 100
+# Sin ?limit se devuelve una página de este tamaño (y X-Next-Token si hay más):
+# el historial completo puede superar los 6 MB y los 29 s de API Gateway
+DEFAULT_LIMIT = MAX_LIMIT
+
+# ?vista=resumen devuelve solo estos atributos (sin la lista de productos)
+PROYECCION_RESUMEN = 'compra_id, fecha, resumen'
+
 # Custom encoder para manejar Decimals
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
@@ -19,9 +35,78 @@ class DecimalEncoder(json.JSONEncoder):
             return float(o)
         return super(DecimalEncoder, self).default(o)
 
+def codificar_cursor(last_evaluated_key):
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode()).decode()
+
+def decodificar_cursor(cursor, tenant_user):
+    # El cursor es opaco para el cliente; se rechaza si no pertenece al mismo usuario
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(clave, dict) or clave.get('tenant_user') != tenant_user:
+        return None
+    return clave
+
+def hasta_completo(hasta):
+    # 'fecha' se guarda como '%Y-%m-%d %H:%M:%S'; una fecha sola en 'hasta' incluye todo ese día
+    if hasta and len(hasta) == 10:
+        return hasta + ' 23:59:59'
+    return hasta
+
+def condicion_fechas(tenant_user, desde, hasta):
+    condicion = Key('tenant_user').eq(tenant_user)
+    hasta = hasta_completo(hasta)
+    if desde and hasta:
+        return condicion & Key('fecha').between(desde, hasta)
+    if desde:
+        return condicion & Key('fecha').gte(desde)
+    if hasta:
+        return condicion & Key('fecha').lte(hasta)
+    return condicion
+
+def calcular_etag(tabla, tenant_user, params):
+    # La compra más reciente del usuario (una lectura de 1 ítem) identifica la versión del historial
+    ultima = tabla.query(
+        IndexName=INDICE_USUARIO,
+        KeyConditionExpression=Key('tenant_user').eq(tenant_user),
+        ScanIndexForward=False,
+        Limit=1,
+        ProjectionExpression='compra_id, fecha'
+    ).get('Items', [])
+    version = f"{ultima[0]['fecha']}|{ultima[0]['compra_id']}" if ultima else 'sin-compras'
+    consulta = '|'.join(params.get(p) or '' for p in ('vista', 'limit', 'next', 'desde', 'hasta'))
+    # Débil: el mismo contenido puede viajar con distinta Content-Encoding
+    return 'W/"' + hashlib.sha256(f'{tenant_user}|{version}|{consulta}'.encode()).hexdigest()[:32] + '"'
+
+def coincide_etag(if_none_match, etag):
+    if not if_none_match:
+        return False
+    etiquetas = [e.strip() for e in if_none_match.split(',')]
+    return '*' in etiquetas or any(e.removeprefix('W/') == etag.removeprefix('W/') for e in etiquetas)
+
+def continuar_en_archivo(datos_token, inicio, faltantes, params, vista):
+    """
+    Compras archivadas en S3 que siguen a la parte caliente del historial.
+    Devuelve (compras, clave para el cursor o None).
+    """
+    s3 = boto3.client('s3')
+    prefijo = archivo_compras.prefijo_usuario(datos_token['tenant_id'], datos_token['user_id'])
+    filtros = {'desde': params.get('desde'), 'hasta': hasta_completo(params.get('hasta'))}
+    start_after = (inicio or {}).get('archivo')
+
+    if faltantes == 0:
+        # Página completa con la tabla: solo se averigua si el archivo tiene más
+        claves, _ = archivo_compras.listar_claves(s3, prefijo, start_after, 1, **filtros)
+        return [], (start_after or '') if claves else None
+
+    claves, hay_mas = archivo_compras.listar_claves(s3, prefijo, start_after, faltantes, **filtros)
+    compras = archivo_compras.leer_compras(s3, claves, vista)
+    return compras, claves[-1] if hay_mas else None
+
 def lambda_handler(event, context):
     print("Evento recibido:", event)
-    
+
     # Manejar requests OPTIONS para CORS preflight
     if event.get('httpMethod') == 'OPTIONS':
         return {
@@ -29,9 +114,9 @@ def lambda_handler(event, context):
             'headers': cors_headers,
             'body': json.dumps({'message': 'CORS preflight'})
         }
-    
+
     # Validar el token
-    token_validacion = validar_token(event['headers'])
+    token_validacion = obtener_datos_token(event)
     if not token_validacion['ok']:
         # Agregar headers CORS a la respuesta de error
         error_response = token_validacion['respuesta']
@@ -39,26 +124,93 @@ def lambda_handler(event, context):
         return error_response
 
     datos_token = token_validacion['datos']
+    params = event.get('queryStringParameters') or {}
+    tenant_user = f"{datos_token['tenant_id']}#{datos_token['user_id']}"
 
     # Obtener tabla desde variable de entorno
     tabla = boto3.resource('dynamodb').Table(os.environ['COMPRAS_TABLE'])
 
     try:
-        # Obtener compras del usuario y tenant autenticado
-        resultado = tabla.scan(
-            FilterExpression='user_id = :uid AND tenant_id = :tid',
-            ExpressionAttributeValues={
-                ':uid': datos_token['user_id'],
-                ':tid': datos_token['tenant_id']
-            }
-        )
+        limit = DEFAULT_LIMIT
+        if params.get('limit'):
+            try:
+                limit = int(params['limit'])
+            except ValueError:
+                limit = 0
+            if not 1 <= limit <= MAX_LIMIT:
+                return {
+                    'statusCode': 400,
+                    'headers': cors_headers,
+                    'body': json.dumps({'error': f'limit debe estar entre 1 y {MAX_LIMIT}'})
+                }
 
-        return {
-            'statusCode': 200,
-            'headers': cors_headers,
-            'body': json.dumps(resultado.get('Items', []), cls=DecimalEncoder)
+        # Obtener compras del usuario y tenant autenticado (más recientes primero)
+        kwargs = {
+            'IndexName': INDICE_USUARIO,
+            'KeyConditionExpression': condicion_fechas(tenant_user, params.get('desde'), params.get('hasta')),
+            'ScanIndexForward': False
         }
-    
+
+        vista = params.get('vista', 'completa')
+        if vista not in ('completa', 'resumen'):
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': 'vista debe ser completa o resumen'})
+            }
+        if vista == 'resumen':
+            kwargs['ProjectionExpression'] = PROYECCION_RESUMEN
+
+        inicio = None
+        if params.get('next'):
+            inicio = decodificar_cursor(params['next'], tenant_user)
+            if not inicio:
+                return {
+                    'statusCode': 400,
+                    'headers': cors_headers,
+                    'body': json.dumps({'error': 'Cursor next inválido'})
+                }
+            if 'archivo' not in inicio:
+                kwargs['ExclusiveStartKey'] = inicio
+
+        # Si el cliente ya tiene esta versión del historial, 304 sin consultar las compras
+        etag = calcular_etag(tabla, tenant_user, params)
+        headers = dict(cors_headers, ETag=etag)
+        headers['Cache-Control'] = 'private, no-cache'
+        if coincide_etag(obtener_header(event, 'If-None-Match'), etag):
+            return {
+                'statusCode': 304,
+                'headers': headers,
+                'body': ''
+            }
+
+        compras = []
+        siguiente = None
+        # Un cursor de archivo indica que la parte en DynamoDB ya se recorrió
+        while not (inicio and 'archivo' in inicio):
+            kwargs['Limit'] = limit - len(compras)
+            resultado = tabla.query(**kwargs)
+            compras.extend(resultado.get('Items', []))
+            siguiente = resultado.get('LastEvaluatedKey')
+
+            # Una página y su cursor
+            if not siguiente or len(compras) >= limit:
+                break
+            kwargs['ExclusiveStartKey'] = siguiente
+
+        # Agotada la tabla, el historial sigue en el archivo frío de S3
+        if not siguiente and archivo_compras.COMPRAS_ARCHIVO_BUCKET:
+            faltantes = limit - len(compras)
+            archivadas, clave = continuar_en_archivo(datos_token, inicio, faltantes, params, vista)
+            compras.extend(archivadas)
+            if clave is not None:
+                siguiente = {'tenant_user': tenant_user, 'archivo': clave}
+
+        if siguiente:
+            headers['X-Next-Token'] = codificar_cursor(siguiente)
+
+        return responder(event, 200, headers, json.dumps(compras, cls=DecimalEncoder))
+
     except Exception as e:
         print("ERROR:", str(e))
         return {
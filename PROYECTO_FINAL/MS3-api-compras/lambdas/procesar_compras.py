@@ -0,0 +1,247 @@
+import json
+import time
+from botocore.exceptions import ClientError
+from lambdas.registrar_compra import (
+    MAX_OPERACIONES, MAX_REINTENTOS, PENDIENTE, REGISTRADA, RECHAZADA, DemasiadasOperaciones,
+    StockInsuficiente, compras_table,
+    condicion_version, construir_compra, dynamodb, estado_table, leer_productos, productos_table,
+    reservar_stock_y_registrar, serializer, shards_table
+)
+from utils.stock_shards import elegir_shards, es_sharded, leer_shards
+
+# Worker del modo asíncrono: drena la cola de pedidos y agrupa las reservas por
+# producto, de modo que un lote de N pedidos sobre los mismos productos se
+# registra con un único descuento condicional por producto.
+
+def marcar_estado(compra_id, estado, error=None):
+    valores = {':e': estado, ':p': PENDIENTE}
+    kwargs = {}
+    expresion = 'SET estado = :e'
+    if error:
+        # 'error' es palabra reservada de DynamoDB
+        expresion += ', #err = :err'
+        valores[':err'] = error
+        kwargs['ExpressionAttributeNames'] = {'#err': 'error'}
+    try:
+        estado_table.update_item(
+            Key={'compra_id': compra_id},
+            UpdateExpression=expresion,
+            ConditionExpression='estado = :p',
+            ExpressionAttributeValues=valores,
+            **kwargs
+        )
+    except ClientError as e:
+        # Reentrega de un pedido ya resuelto
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def compras_registradas(compra_ids):
+    """
+    compra_id que ya existen en la tabla de compras. Un mensaje reentregado
+    cuya transacción ya se confirmó no se vuelve a validar contra el stock
+    """
+    existentes = set()
+    for i in range(0, len(compra_ids), 100):
+        pendientes = {compras_table.name: {
+            'Keys': [{'compra_id': c} for c in compra_ids[i:i + 100]],
+            'ProjectionExpression': 'compra_id',
+            'ConsistentRead': True
+        }}
+        for intento in range(MAX_REINTENTOS + 1):
+            respuesta = dynamodb.batch_get_item(RequestItems=pendientes)
+            existentes.update(item['compra_id'] for item in respuesta.get('Responses', {}).get(compras_table.name, []))
+            pendientes = respuesta.get('UnprocessedKeys') or {}
+            if not pendientes:
+                break
+            if intento < MAX_REINTENTOS:
+                time.sleep(0.05 * (2 ** intento))
+        else:
+            raise Exception('No se pudieron leer todas las compras (UnprocessedKeys)')
+    return existentes
+
+def productos_confirmados(pedido, items):
+    return [{
+        'codigo': codigo,
+        'nombre': items[codigo]['nombre'],
+        'precio_unitario': items[codigo]['precio'],
+        'cantidad': cantidad
+    } for codigo, cantidad in pedido['cantidades'].items()]
+
+def registrar_grupo(grupo, items):
+    # Un descuento condicional por producto con la suma del grupo + el put de cada compra
+    totales = {}
+    for pedido in grupo:
+        for codigo, cantidad in pedido['cantidades'].items():
+            totales[codigo] = totales.get(codigo, 0) + cantidad
+
+    operaciones = []
+    for codigo, total in totales.items():
+        condicion, valores = condicion_version(items[codigo].get('version'))
+        operaciones.append({
+            'Update': {
+                'TableName': productos_table.name,
+                'Key': {'codigo': {'S': codigo}},
+                'UpdateExpression': 'SET cantidad = cantidad - :c',
+                'ConditionExpression': f'cantidad >= :c AND attribute_not_exists(shards) AND {condicion}',
+                'ExpressionAttributeNames': {'#v': 'version'},
+                'ExpressionAttributeValues': dict(valores, **{':c': serializer.serialize(total)})
+            }
+        })
+    for pedido in grupo:
+        compra = construir_compra(pedido['compra_id'], pedido, productos_confirmados(pedido, items))
+        operaciones.append({
+            'Put': {
+                'TableName': compras_table.name,
+                'Item': {k: serializer.serialize(v) for k, v in compra.items()},
+                'ConditionExpression': 'attribute_not_exists(compra_id)'
+            }
+        })
+
+    dynamodb.meta.client.transact_write_items(TransactItems=operaciones)
+
+def registrar_individual(pedido, items):
+    # Misma reserva que el modo síncrono, para un solo pedido
+    asignaciones = {}
+    for codigo, cantidad in pedido['cantidades'].items():
+        if es_sharded(items[codigo]):
+            asignacion = elegir_shards(leer_shards(shards_table, codigo, int(items[codigo]['shards'])), cantidad)
+            if asignacion is None:
+                raise StockInsuficiente(codigo)
+            asignaciones[codigo] = asignacion
+
+    compra = construir_compra(pedido['compra_id'], pedido, productos_confirmados(pedido, items))
+    versiones = {codigo: items[codigo].get('version') for codigo in pedido['cantidades']}
+    try:
+        reservar_stock_y_registrar(pedido['cantidades'], compra, asignaciones, versiones)
+    except ClientError as e:
+        razones = e.response.get('CancellationReasons') or [{}]
+        # Falló solo el put: la compra ya estaba registrada (reentrega del mensaje)
+        if razones[-1].get('Code') != 'ConditionalCheckFailed':
+            raise
+
+def agrupar(pedidos):
+    # Reparte los pedidos en grupos que entran en una transacción
+    grupo, codigos = [], set()
+    for pedido in pedidos:
+        nuevos = codigos | set(pedido['cantidades'])
+        if grupo and len(nuevos) + len(grupo) + 1 > MAX_OPERACIONES:
+            yield grupo
+            grupo, nuevos = [], set(pedido['cantidades'])
+        grupo.append(pedido)
+        codigos = nuevos
+    if grupo:
+        yield grupo
+
+def procesar_pedidos(pedidos):
+    """
+    Registra un lote de pedidos encolados. Devuelve ({compra_id: estado},
+    {compra_id de los pedidos que fallaron y deben reentregarse})
+    """
+    estados, fallidos = {}, set()
+    codigos = {codigo for pedido in pedidos for codigo in pedido['cantidades']}
+    items = leer_productos(list(codigos)) if codigos else {}
+    registradas = compras_registradas(list({pedido['compra_id'] for pedido in pedidos}))
+
+    def rechazar(pedido, motivo):
+        try:
+            marcar_estado(pedido['compra_id'], RECHAZADA, motivo)
+            estados[pedido['compra_id']] = RECHAZADA
+        except Exception as e:
+            print("ERROR:", pedido['compra_id'], str(e))
+            fallidos.add(pedido['compra_id'])
+
+    # Asignar el stock leído a los pedidos en orden de llegada
+    disponible = {codigo: item.get('cantidad', 0) for codigo, item in items.items()}
+    aceptados, individuales = [], []
+    for pedido in pedidos:
+        if pedido['compra_id'] in registradas:
+            # Reentrega de un pedido ya registrado (falló marcar_estado): solo se marca
+            try:
+                marcar_estado(pedido['compra_id'], REGISTRADA)
+                estados[pedido['compra_id']] = REGISTRADA
+            except Exception as e:
+                print("ERROR:", pedido['compra_id'], str(e))
+                fallidos.add(pedido['compra_id'])
+            continue
+
+        faltante = next((c for c in pedido['cantidades'] if c not in items), None)
+        if faltante:
+            rechazar(pedido, f'Producto {faltante} no encontrado')
+            continue
+
+        if any(es_sharded(items[c]) for c in pedido['cantidades']):
+            individuales.append(pedido)
+            continue
+
+        sin_stock = next((c for c, q in pedido['cantidades'].items() if disponible[c] < q), None)
+        if sin_stock:
+            rechazar(pedido, f'Stock insuficiente para {sin_stock}')
+            continue
+
+        for codigo, cantidad in pedido['cantidades'].items():
+            disponible[codigo] -= cantidad
+        aceptados.append(pedido)
+
+    for grupo in agrupar(aceptados):
+        try:
+            registrar_grupo(grupo, items)
+        except Exception as e:
+            if not (isinstance(e, ClientError) and e.response['Error']['Code'] == 'TransactionCanceledException'):
+                print("ERROR:", str(e))
+            # El stock cambió, hay pedidos reentregados o falló la transacción: se registran uno a uno
+            individuales.extend(grupo)
+            continue
+        for pedido in grupo:
+            try:
+                marcar_estado(pedido['compra_id'], REGISTRADA)
+                estados[pedido['compra_id']] = REGISTRADA
+            except Exception as e:
+                # La compra ya quedó registrada: la reentrega solo marca el estado
+                print("ERROR:", pedido['compra_id'], str(e))
+                fallidos.add(pedido['compra_id'])
+
+    for pedido in individuales:
+        try:
+            try:
+                registrar_individual(pedido, items)
+            except StockInsuficiente:
+                # Puede ser falta de stock o un cambio de versión del catálogo
+                # (nombre/precio): se releen los productos y se reintenta una vez
+                items.update(leer_productos(list(pedido['cantidades'])))
+                registrar_individual(pedido, items)
+            marcar_estado(pedido['compra_id'], REGISTRADA)
+            estados[pedido['compra_id']] = REGISTRADA
+        except (StockInsuficiente, DemasiadasOperaciones) as e:
+            rechazar(pedido, str(e))
+        except Exception as e:
+            print("ERROR:", pedido['compra_id'], str(e))
+            fallidos.add(pedido['compra_id'])
+
+    return estados, fallidos
+
+def lambda_handler(event, context):
+    # ReportBatchItemFailures: solo se reentregan los mensajes fallidos; tras
+    # maxReceiveCount intentos SQS los mueve a la DLQ
+    pedidos, mensajes, fallas = [], {}, []
+    for record in event.get('Records', []):
+        try:
+            pedido = json.loads(record['body'])
+            mensajes.setdefault(pedido['compra_id'], []).append(record['messageId'])
+        except (ValueError, KeyError, TypeError) as e:
+            print("ERROR: mensaje inválido", record['messageId'], str(e))
+            fallas.append(record['messageId'])
+            continue
+        pedidos.append(pedido)
+    print(f"Procesando {len(pedidos)} pedidos")
+
+    try:
+        estados, fallidos = procesar_pedidos(pedidos)
+    except Exception as e:
+        # Falló la lectura de productos: se reentrega el lote completo
+        print("ERROR:", str(e))
+        estados, fallidos = {}, set(mensajes)
+
+    for compra_id in fallidos:
+        fallas.extend(mensajes.get(compra_id, []))
+    print("Estados:", estados, "Fallidos:", len(fallas))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in fallas]}
@@ -0,0 +1,63 @@
+import boto3
+import os
+import time
+from botocore.exceptions import ClientError
+from utils.stock_shards import MAX_REINTENTOS, es_sharded, productos_sharded, publicar_total, quitar_sharded, rebalancear
+
+dynamodb = boto3.resource('dynamodb')
+productos_table = dynamodb.Table(os.environ['PRODUCTOS_TABLE'])
+shards_table = dynamodb.Table(os.environ['STOCK_SHARDS_TABLE'])
+
+def leer_productos(codigos):
+    """Lee codigo, shards y cantidad de los productos registrados (de a 100 claves)"""
+    productos = {}
+    for inicio in range(0, len(codigos), 100):
+        pendientes = {productos_table.name: {
+            'Keys': [{'codigo': c} for c in codigos[inicio:inicio + 100]],
+            'ProjectionExpression': 'codigo, shards, cantidad',
+            'ConsistentRead': True
+        }}
+        for intento in range(MAX_REINTENTOS + 1):
+            respuesta = dynamodb.batch_get_item(RequestItems=pendientes)
+            for item in respuesta['Responses'].get(productos_table.name, []):
+                productos[item['codigo']] = item
+            pendientes = respuesta.get('UnprocessedKeys') or {}
+            if not pendientes:
+                break
+            if intento == MAX_REINTENTOS:
+                raise RuntimeError('No se pudieron leer todos los productos sharded')
+            time.sleep(0.05 * 2 ** intento)
+    return productos
+
+def lambda_handler(event, context):
+    # Ejecución periódica: publica el total de cada producto sharded y reparte sus shards.
+    # Los productos salen del registro de la tabla de shards, sin escanear t_MS2_productos.
+    codigos = productos_sharded(shards_table)
+    productos = leer_productos(codigos)
+    resumen = {'publicados': 0, 'sin_cambios': 0, 'rebalanceados': 0, 'en_conflicto': 0, 'quitados': 0}
+
+    for codigo in codigos:
+        producto = productos.get(codigo)
+        if producto is None or not es_sharded(producto):
+            # Eliminado en MS2 o ya no sharded: deja de rebalancearse
+            quitar_sharded(shards_table, codigo)
+            resumen['quitados'] += 1
+            continue
+
+        n = int(producto['shards'])
+        total, escrito = publicar_total(productos_table, shards_table, codigo, n, producto.get('cantidad'))
+        resumen['publicados' if escrito else 'sin_cambios'] += 1
+        try:
+            if rebalancear(dynamodb, shards_table, codigo, n):
+                print(f"Producto {codigo}: {total} unidades repartidas en {n} shards")
+                resumen['rebalanceados'] += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            # Hubo compras durante el rebalanceo; el total ya quedó publicado y
+            # el reparto se reintenta en la próxima ejecución
+            print(f"Producto {codigo}: rebalanceo cancelado por concurrencia")
+            resumen['en_conflicto'] += 1
+
+    print("Resumen rebalanceo:", resumen)
+    return resumen
@@ -2,20 +2,311 @@ import boto3
 import json
 import uuid
 import os
+import time
 from datetime import datetime
-from middleware.validarTokenAcceso import validar_token
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from middleware.validarTokenAcceso import obtener_datos_token
+from middleware.idempotencia import COMPLETADA, completar, liberar, obtener_clave, reservar
+from utils.stock_shards import elegir_shards, es_sharded, leer_shards, operaciones_descuento
+from utils import cache_catalogo
+from utils.cola_compras import obtener_cola
+from utils.resumen_compra import calcular_resumen
+from utils.indice_tenant import shard_tenant
+from utils.compresion import leer_body
 
 # Headers CORS para todas las respuestas
 cors_headers = {
     'Content-Type': 'application/json',
     'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,Idempotency-Key,Prefer',
     'Access-Control-Allow-Methods': 'POST, OPTIONS'
 }
 
 dynamodb = boto3.resource('dynamodb')
 productos_table = dynamodb.Table(os.environ['PRODUCTOS_TABLE'])
 compras_table = dynamodb.Table(os.environ['COMPRAS_TABLE'])
+shards_table = dynamodb.Table(os.environ['STOCK_SHARDS_TABLE'])
+estado_table = dynamodb.Table(os.environ['COMPRAS_ESTADO_TABLE'])
+serializer = TypeSerializer()
+
+# TransactWriteItems admite 100 operaciones. Un producto normal usa una (su
+# descuento) y uno sharded usa un descuento por shard asignado + su ConditionCheck;
+# se suma el put de la compra. MAX_PRODUCTOS es solo el tope previo por códigos.
+MAX_OPERACIONES = 100
+MAX_PRODUCTOS = MAX_OPERACIONES - 1
+MAX_REINTENTOS = 5
+
+# 'sync' registra la compra en el request; 'async' la encola y responde 202
+COMPRAS_MODO = os.environ.get('COMPRAS_MODO', 'sync')
+ESTADO_TTL = 7 * 24 * 60 * 60
+
+# Días que una compra vive en DynamoDB; después el TTL la pasa al archivo en S3
+COMPRAS_HOT_DIAS = int(os.environ.get('COMPRAS_HOT_DIAS', '365'))
+PENDIENTE, REGISTRADA, RECHAZADA = 'pendiente', 'registrada', 'rechazada'
+
+class StockInsuficiente(Exception):
+    def __init__(self, codigo):
+        super().__init__(f'Stock insuficiente para {codigo}')
+        self.codigo = codigo
+
+class DemasiadasOperaciones(Exception):
+    def __init__(self, operaciones):
+        super().__init__(
+            f'La compra requiere {operaciones} operaciones de stock (máximo {MAX_OPERACIONES}); '
+            'divide el carrito en varias compras'
+        )
+        self.operaciones = operaciones
+
+def leer_productos(codigos):
+    # Un solo batch_get_item para todos los productos, reintentando UnprocessedKeys
+    items = {}
+    pendientes = {productos_table.name: {
+        'Keys': [{'codigo': c} for c in codigos],
+        'ProjectionExpression': 'codigo, nombre, precio, cantidad, shards, #v',
+        'ExpressionAttributeNames': {'#v': 'version'}
+    }}
+    for intento in range(MAX_REINTENTOS + 1):
+        respuesta = dynamodb.batch_get_item(RequestItems=pendientes)
+        for item in respuesta.get('Responses', {}).get(productos_table.name, []):
+            items[item['codigo']] = item
+
+        pendientes = respuesta.get('UnprocessedKeys') or {}
+        if not pendientes:
+            return items
+        if intento < MAX_REINTENTOS:
+            time.sleep(0.05 * (2 ** intento))
+
+    raise Exception('No se pudieron leer todos los productos (UnprocessedKeys)')
+
+def condicion_version(version):
+    # La transacción falla si nombre/precio cambiaron (nueva 'version') desde que se leyeron
+    if version is None:
+        return 'attribute_not_exists(#v)', {}
+    return '#v = :v', {':v': serializer.serialize(version)}
+
+def reservar_stock_y_registrar(cantidades, compra, asignaciones, versiones):
+    # Descuentos condicionales de stock y put de la compra en una sola transacción:
+    # si algún producto no tiene stock no se descuenta ninguno.
+    # Los productos sharded descuentan de los shards elegidos en 'asignaciones'.
+    operaciones = []
+    codigos = []  # código afectado por cada operación, para interpretar cancelaciones
+    for codigo, cantidad in cantidades.items():
+        condicion, valores = condicion_version(versiones.get(codigo))
+        if codigo in asignaciones:
+            verificacion = {
+                'TableName': productos_table.name,
+                'Key': {'codigo': {'S': codigo}},
+                'ConditionExpression': condicion,
+                'ExpressionAttributeNames': {'#v': 'version'}
+            }
+            if valores:
+                verificacion['ExpressionAttributeValues'] = valores
+            descuentos = operaciones_descuento(shards_table.name, codigo, asignaciones[codigo])
+            descuentos.append({'ConditionCheck': verificacion})
+        else:
+            # attribute_not_exists(shards): si el producto pasó a shards, su
+            # 'cantidad' ya no es el stock real y no se descuenta de ahí
+            descuentos = [{
+                'Update': {
+                    'TableName': productos_table.name,
+                    'Key': {'codigo': {'S': codigo}},
+                    'UpdateExpression': 'SET cantidad = cantidad - :c',
+                    'ConditionExpression': f'cantidad >= :c AND attribute_not_exists(shards) AND {condicion}',
+                    'ExpressionAttributeNames': {'#v': 'version'},
+                    'ExpressionAttributeValues': dict(valores, **{':c': serializer.serialize(cantidad)})
+                }
+            }]
+        operaciones.extend(descuentos)
+        codigos.extend([codigo] * len(descuentos))
+
+    operaciones.append({
+        'Put': {
+            'TableName': compras_table.name,
+            'Item': {k: serializer.serialize(v) for k, v in compra.items()},
+            'ConditionExpression': 'attribute_not_exists(compra_id)'
+        }
+    })
+    if len(operaciones) > MAX_OPERACIONES:
+        # Los shards asignados pueden superar el límite aunque haya pocos códigos
+        raise DemasiadasOperaciones(len(operaciones))
+
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=operaciones)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        # El stock (o la versión del catálogo) cambió entre la lectura y la transacción
+        razones = e.response.get('CancellationReasons', [])
+        for i, razon in enumerate(razones[:len(codigos)]):
+            if razon.get('Code') == 'ConditionalCheckFailed':
+                raise StockInsuficiente(codigos[i])
+        raise
+
+def validar_carrito(body):
+    # Valida el carrito y agrupa cantidades por código (una operación por producto).
+    # Devuelve (cantidades, None) o (None, respuesta de error)
+    productos = body.get('productos', [])
+
+    if not productos:
+        return None, {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({'error': 'Debes incluir productos en la compra'})
+        }
+
+    cantidades = {}
+    for p in productos:
+        codigo = p.get('codigo')
+        cantidad = p.get('cantidad', 1)
+
+        if not codigo or cantidad <= 0:
+            return None, {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': f'Producto inválido: {p}'})
+            }
+
+        cantidades[codigo] = cantidades.get(codigo, 0) + cantidad
+
+    if len(cantidades) > MAX_PRODUCTOS:
+        return None, {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({'error': f'Máximo {MAX_PRODUCTOS} productos distintos por compra'})
+        }
+
+    return cantidades, None
+
+def construir_compra(compra_id, datos_token, productos_confirmados):
+    return {
+        'compra_id': compra_id,
+        'user_id': datos_token['user_id'],
+        'tenant_id': datos_token['tenant_id'],  # ← NUEVO: se asocia compra al tenant
+        'tenant_user': f"{datos_token['tenant_id']}#{datos_token['user_id']}",  # clave del índice por usuario
+        'tenant_shard': shard_tenant(datos_token['tenant_id'], compra_id),  # clave del índice por tenant
+        'productos': productos_confirmados,
+        'resumen': calcular_resumen(productos_confirmados),
+        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'archivar_en': int(time.time()) + COMPRAS_HOT_DIAS * 24 * 60 * 60
+    }
+
+def encolar_compra(datos_token, body, event):
+    # Modo asíncrono: valida, deja la compra 'pendiente' y la encola para el worker
+    cantidades, error = validar_carrito(body)
+    if error:
+        return error
+
+    compra_id = str(uuid.uuid4())
+    tenant_user = f"{datos_token['tenant_id']}#{datos_token['user_id']}"
+    estado_table.put_item(Item={
+        'compra_id': compra_id,
+        'tenant_user': tenant_user,
+        'estado': PENDIENTE,
+        'expires': int(time.time()) + ESTADO_TTL
+    })
+    obtener_cola().enviar({
+        'compra_id': compra_id,
+        'user_id': datos_token['user_id'],
+        'tenant_id': datos_token['tenant_id'],
+        'cantidades': cantidades
+    })
+
+    ruta = f'/compras/estado/{compra_id}'
+    contexto = event.get('requestContext') or {}
+    host = (event.get('headers') or {}).get('Host')
+    estado_url = f"https://{host}/{contexto['stage']}{ruta}" if host and contexto.get('stage') else ruta
+
+    return {
+        'statusCode': 202,
+        'headers': dict(cors_headers, Location=estado_url),
+        'body': json.dumps({'mensaje': 'Compra en proceso', 'compra_id': compra_id, 'estado_url': estado_url})
+    }
+
+def registrar_compra(datos_token, body, reintento=False):
+    cantidades, error = validar_carrito(body)
+    if error:
+        return error
+
+    # Nombre y precio salen del cache de catálogo; solo se leen de la tabla los que faltan
+    catalogo = {}
+    for codigo in cantidades:
+        atributos = cache_catalogo.obtener(codigo)
+        if atributos:
+            catalogo[codigo] = atributos
+    faltantes = [codigo for codigo in cantidades if codigo not in catalogo]
+    items = leer_productos(faltantes) if faltantes else {}
+    for item in items.values():
+        cache_catalogo.guardar(item)
+
+    productos_confirmados = []
+    asignaciones = {}
+    versiones = {}
+
+    for codigo, cantidad in cantidades.items():
+        item = items.get(codigo) or catalogo.get(codigo)
+
+        if not item:
+            return {
+                'statusCode': 404,
+                'headers': cors_headers,
+                'body': json.dumps({'error': f'Producto {codigo} no encontrado'})
+            }
+
+        if es_sharded(item):
+            # Stock repartido en shards: elegir de cuáles descontar
+            asignacion = elegir_shards(leer_shards(shards_table, codigo, int(item['shards'])), cantidad)
+            hay_stock = asignacion is not None
+            if hay_stock:
+                asignaciones[codigo] = asignacion
+        elif codigo in items:
+            hay_stock = item.get('cantidad', 0) >= cantidad
+        else:
+            # Producto servido desde el cache: el stock lo verifica la transacción
+            hay_stock = True
+
+        if not hay_stock:
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': f'Stock insuficiente para {codigo}'})
+            }
+
+        versiones[codigo] = item.get('version')
+        productos_confirmados.append({
+            'codigo': codigo,
+            'nombre': item['nombre'],
+            'precio_unitario': item['precio'],
+            'cantidad': cantidad
+        })
+
+    compra = construir_compra(str(uuid.uuid4()), datos_token, productos_confirmados)
+
+    try:
+        reservar_stock_y_registrar(cantidades, compra, asignaciones, versiones)
+    except StockInsuficiente as e:
+        if not reintento:
+            # Puede ser falta de stock o un cambio de precio/nombre: se relee el
+            # producto de la tabla y se reintenta una vez
+            cache_catalogo.invalidar(e.codigo)
+            return registrar_compra(datos_token, body, reintento=True)
+        return {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
+    except DemasiadasOperaciones as e:
+        return {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': cors_headers,
+        'body': json.dumps({'mensaje': 'Compra registrada', 'compra_id': compra['compra_id']})
+    }
 
 def lambda_handler(event, context):
     print("Evento recibido:", event)
@@ -30,7 +321,7 @@ def lambda_handler(event, context):
     
     try:
         # Validar token
-        token_validacion = validar_token(event['headers'])
+        token_validacion = obtener_datos_token(event)
         if not token_validacion['ok']:
             # Agregar headers CORS a la respuesta de error
             error_response = token_validacion['respuesta']
@@ -38,76 +329,50 @@ def lambda_handler(event, context):
             return error_response
 
         datos_token = token_validacion['datos']
-        body = json.loads(event['body'])
-        productos = body.get('productos', [])
-
-        if not productos:
-            return {
-                'statusCode': 400,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'Debes incluir productos en la compra'})
-            }
-
-        productos_confirmados = []
-
-        for p in productos:
-            codigo = p.get('codigo')
-            cantidad = p.get('cantidad', 1)
-
-            if not codigo or cantidad <= 0:
-                return {
-                    'statusCode': 400,
-                    'headers': cors_headers,
-                    'body': json.dumps({'error': f'Producto inválido: {p}'})
-                }
-
-            resultado = productos_table.get_item(Key={'codigo': codigo})
-            item = resultado.get('Item')
-
-            if not item:
-                return {
-                    'statusCode': 404,
-                    'headers': cors_headers,
-                    'body': json.dumps({'error': f'Producto {codigo} no encontrado'})
-                }
+        body = json.loads(leer_body(event))
 
-            if item.get('cantidad', 0) < cantidad:
+        # Idempotency-Key: un reintento devuelve la respuesta guardada sin tocar productos
+        clave = obtener_clave(event, datos_token)
+        if clave:
+            previo = reservar(clave)
+            if previo:
+                if previo.get('estado') == COMPLETADA:
+                    return {
+                        'statusCode': int(previo['status_code']),
+                        'headers': dict(cors_headers, **{'Idempotent-Replayed': 'true'}),
+                        'body': previo['body']
+                    }
+                # Pasado el lease de la reserva, un reintento puede tomarla
+                espera = max(1, int(previo.get('en_proceso_hasta', 0)) - int(time.time()))
                 return {
-                    'statusCode': 400,
-                    'headers': cors_headers,
-                    'body': json.dumps({'error': f'Stock insuficiente para {codigo}'})
+                    'statusCode': 409,
+                    'headers': dict(cors_headers, **{'Retry-After': str(espera)}),
+                    'body': json.dumps({'error': 'Ya hay una compra en proceso con esta Idempotency-Key'})
                 }
 
-            # Descontar stock
-            productos_table.update_item(
-                Key={'codigo': codigo},
-                UpdateExpression='SET cantidad = cantidad - :c',
-                ConditionExpression='cantidad >= :c',
-                ExpressionAttributeValues={':c': cantidad}
-            )
-
-            productos_confirmados.append({
-                'codigo': codigo,
-                'nombre': item['nombre'],
-                'precio_unitario': item['precio'],
-                'cantidad': cantidad
-            })
-
-        compra = {
-            'compra_id': str(uuid.uuid4()),
-            'user_id': datos_token['user_id'],
-            'tenant_id': datos_token['tenant_id'],  # ← NUEVO: se asocia compra al tenant
-            'productos': productos_confirmados,
-            'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        # Modo asíncrono por configuración o a pedido del cliente (Prefer: respond-async)
+        asincrono = COMPRAS_MODO == 'async' or any(
+            nombre.lower() == 'prefer' and 'respond-async' in (valor or '')
+            for nombre, valor in (event.get('headers') or {}).items()
+        )
 
-        compras_table.put_item(Item=compra)
+        try:
+            if asincrono:
+                respuesta = encolar_compra(datos_token, body, event)
+            else:
+                respuesta = registrar_compra(datos_token, body)
+        except Exception:
+            if clave:
+                liberar(clave)
+            raise
 
-        return {
-            'statusCode': 200,
-            'headers': cors_headers,
-            'body': json.dumps({'mensaje': 'Compra registrada', 'compra_id': compra['compra_id']})
-        }
+        if clave:
+            # Solo se recuerda la compra registrada o encolada; los errores pueden reintentarse
+            if respuesta['statusCode'] in (200, 202):
+                completar(clave, respuesta)
+            else:
+                liberar(clave)
+        return respuesta
     
     except Exception as e:
         print("ERROR:", str(e))
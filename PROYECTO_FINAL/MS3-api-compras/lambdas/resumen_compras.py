@@ -0,0 +1,66 @@
+import boto3
+import json
+import os
+from decimal import Decimal
+from middleware.validarTokenAcceso import obtener_datos_token
+from utils.resumen_usuario import formatear
+
+# Headers CORS para todas las respuestas
+cors_headers = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS'
+}
+
+resumen_table = boto3.resource('dynamodb').Table(os.environ['RESUMEN_USUARIOS_TABLE'])
+
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+def lambda_handler(event, context):
+    print("Evento recibido:", event)
+
+    # Manejar requests OPTIONS para CORS preflight
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps({'message': 'CORS preflight'})
+        }
+
+    # Validar el token
+    token_validacion = obtener_datos_token(event)
+    if not token_validacion['ok']:
+        # Agregar headers CORS a la respuesta de error
+        error_response = token_validacion['respuesta']
+        error_response['headers'] = cors_headers
+        return error_response
+
+    datos_token = token_validacion['datos']
+
+    try:
+        # Un get_item sobre el agregado mantenido por el stream, sin recorrer las compras
+        item = resumen_table.get_item(
+            Key={'tenant_user': f"{datos_token['tenant_id']}#{datos_token['user_id']}"}
+        ).get('Item')
+
+        respuesta = formatear(item)
+        respuesta.update({'user_id': datos_token['user_id'], 'tenant_id': datos_token['tenant_id']})
+
+        return {
+            'statusCode': 200,
+            'headers': cors_headers,
+            'body': json.dumps(respuesta, cls=DecimalEncoder)
+        }
+
+    except Exception as e:
+        print("ERROR:", str(e))
+        return {
+            'statusCode': 500,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -0,0 +1,69 @@
+import os
+import time
+import boto3
+from botocore.exceptions import ClientError
+
+dynamodb = boto3.resource('dynamodb')
+
+# Cuánto tiempo se recuerda una Idempotency-Key (atributo TTL 'expires' de la tabla)
+IDEMPOTENCIA_TTL = int(os.environ.get('IDEMPOTENCIA_TTL', str(24 * 60 * 60)))
+
+# Cuánto dura la reserva de un request en proceso. Mayor que el timeout de la
+# función: pasado ese tiempo el request que reservó ya no puede estar vivo
+# (crash o timeout) y un reintento puede tomar la clave.
+IDEMPOTENCIA_LEASE = int(os.environ.get('IDEMPOTENCIA_LEASE', '35'))
+
+EN_PROCESO = 'en_proceso'
+COMPLETADA = 'completada'
+
+
+def obtener_clave(event, datos_token):
+    """Idempotency-Key del request (header sin distinguir mayúsculas), acotada al usuario"""
+    for nombre, valor in (event.get('headers') or {}).items():
+        if nombre.lower() == 'idempotency-key' and valor:
+            return f"{datos_token['tenant_id']}#{datos_token['user_id']}#{valor}"
+    return None
+
+
+def _tabla():
+    return dynamodb.Table(os.environ['IDEMPOTENCIA_TABLE'])
+
+
+def reservar(clave):
+    """
+    Registra la clave de forma condicional.
+    Devuelve None si este request es el primero con esa clave (o si toma una
+    reserva en proceso cuyo lease venció), o el registro existente (en proceso
+    o con la respuesta guardada) si es un reintento.
+    """
+    ahora = int(time.time())
+    try:
+        _tabla().put_item(
+            Item={
+                'clave': clave,
+                'estado': EN_PROCESO,
+                'en_proceso_hasta': ahora + IDEMPOTENCIA_LEASE,
+                'expires': ahora + IDEMPOTENCIA_TTL
+            },
+            ConditionExpression='attribute_not_exists(clave) OR (estado = :p AND en_proceso_hasta < :ahora)',
+            ExpressionAttributeValues={':p': EN_PROCESO, ':ahora': ahora}
+        )
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    return _tabla().get_item(Key={'clave': clave}, ConsistentRead=True).get('Item') or {'estado': EN_PROCESO}
+
+
+def completar(clave, respuesta):
+    """Guarda la respuesta para devolverla tal cual en los reintentos"""
+    _tabla().update_item(
+        Key={'clave': clave},
+        UpdateExpression='SET estado = :e, status_code = :s, body = :b REMOVE en_proceso_hasta',
+        ExpressionAttributeValues={':e': COMPLETADA, ':s': respuesta['statusCode'], ':b': respuesta['body']}
+    )
+
+
+def liberar(clave):
+    """Borra la clave para que un reintento pueda volver a procesar el request"""
+    _tabla().delete_item(Key={'clave': clave})
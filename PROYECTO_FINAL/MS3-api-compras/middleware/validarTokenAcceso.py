@@ -1,12 +1,86 @@
 import os
 import json
+import time
 import boto3
-from datetime import datetime
+from collections import OrderedDict
+
+from utils.tokens import TokenInvalido, es_token_firmado, expires_epoch, tokens_firmados_activos, verificar_token
 
 dynamodb = boto3.resource('dynamodb')
 
-def validar_token(headers):
+# Cache LRU en memoria del contenedor para no leer la tabla de tokens en cada request.
+# Cada entrada vive como máximo TOKEN_CACHE_TTL segundos y nunca más allá del 'expires'
+# del propio token; los tokens inexistentes se cachean TOKEN_CACHE_NEGATIVE_TTL segundos.
+TOKEN_CACHE_MAX = int(os.environ.get('TOKEN_CACHE_MAX', '1024'))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', '60'))
+TOKEN_CACHE_NEGATIVE_TTL = int(os.environ.get('TOKEN_CACHE_NEGATIVE_TTL', '5'))
+# Cada cuántas consultas al cache se loguean sus contadores (hit rate en CloudWatch)
+TOKEN_CACHE_LOG_CADA = int(os.environ.get('TOKEN_CACHE_LOG_CADA', '100'))
+
+_token_cache = OrderedDict()  # token -> (item o None, vence_en)
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_SIN_CACHE = object()
+
+
+def _cache_get(token):
+    entrada = _token_cache.get(token)
+    if entrada is None or entrada[1] <= time.time():
+        if entrada is not None:
+            del _token_cache[token]
+        _cache_stats['misses'] += 1
+        resultado = _SIN_CACHE
+    else:
+        _token_cache.move_to_end(token)
+        _cache_stats['hits'] += 1
+        resultado = entrada[0]
+    if TOKEN_CACHE_LOG_CADA > 0 and (_cache_stats['hits'] + _cache_stats['misses']) % TOKEN_CACHE_LOG_CADA == 0:
+        print("Cache de tokens:", cache_stats())
+    return resultado
+
+
+def _cache_put(token, item):
+    now = time.time()
+    if item is None:
+        vence_en = now + TOKEN_CACHE_NEGATIVE_TTL
+    else:
+        vence_en = min(now + TOKEN_CACHE_TTL, expires_epoch(item['expires']))
+    if vence_en <= now:
+        return
+    _token_cache[token] = (item, vence_en)
+    _token_cache.move_to_end(token)
+    while len(_token_cache) > TOKEN_CACHE_MAX:
+        _token_cache.popitem(last=False)
+        _cache_stats['evictions'] += 1
+
+
+def cache_stats():
+    """Contadores del cache de tokens del contenedor (para dimensionarlo)"""
+    consultas = _cache_stats['hits'] + _cache_stats['misses']
+    return dict(
+        _cache_stats,
+        hit_rate=round(_cache_stats['hits'] / consultas, 3) if consultas else None,
+        size=len(_token_cache),
+        max_size=TOKEN_CACHE_MAX
+    )
+
+
+def _rechazo(status, mensaje):
+    return {
+        'ok': False,
+        'respuesta': {
+            'statusCode': status,
+            'body': json.dumps({'mensaje': mensaje})
+        }
+    }
+
+
+def validar_token(headers, table=None):
+    # 'table' permite inyectar una tabla local (stand-in) en pruebas; por defecto TOKENS_TABLE
+    if not isinstance(headers, dict):
+        return _rechazo(403, 'Headers inválidos')
     raw_token = headers.get('x-auth-token') or headers.get('authorization') or headers.get('Authorization')
+    if raw_token is not None and not isinstance(raw_token, str):
+        return _rechazo(403, 'Token mal formado')
     token = raw_token.replace('Bearer ', '') if raw_token else None
 
     if not token:
@@ -18,13 +92,34 @@ def validar_token(headers):
             }
         }
 
+    # Modo firmado: validación offline, sin round trip a la tabla de tokens
+    if tokens_firmados_activos() and es_token_firmado(token):
+        try:
+            payload = verificar_token(token)
+        except TokenInvalido as e:
+            return _rechazo(403, str(e))
+        return {
+            'ok': True,
+            'datos': {
+                'token': token,
+                'user_id': payload['user_id'],
+                'tenant_id': payload['tenant_id'],
+                'expires': payload['exp']
+            }
+        }
+
     try:
-        table_name = os.environ['TOKENS_TABLE']
-        table = dynamodb.Table(table_name)
+        item = _cache_get(token)
+        if item is _SIN_CACHE:
+            if table is None:
+                table_name = os.environ['TOKENS_TABLE']
+                table = dynamodb.Table(table_name)
 
-        res = table.get_item(Key={'token': token})
+            res = table.get_item(Key={'token': token})
+            item = res.get('Item')
+            _cache_put(token, item)
 
-        if 'Item' not in res:
+        if item is None:
             return {
                 'ok': False,
                 'respuesta': {
@@ -33,9 +128,7 @@ def validar_token(headers):
                 }
             }
 
-        item = res['Item']
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        if now > item['expires']:
+        if time.time() > expires_epoch(item['expires']):
             return {
                 'ok': False,
                 'respuesta': {
@@ -58,3 +151,15 @@ def validar_token(headers):
             }
         }
 
+
+
+def obtener_datos_token(event):
+    """Datos del usuario autenticado: desde el contexto del autorizador de API Gateway
+    si la ruta lo tiene configurado, o validando el token en línea en caso contrario."""
+    contexto = (event.get('requestContext') or {}).get('authorizer') or {}
+    if contexto.get('user_id') and contexto.get('tenant_id'):
+        return {
+            'ok': True,
+            'datos': {'user_id': contexto['user_id'], 'tenant_id': contexto['tenant_id']}
+        }
+    return validar_token(event.get('headers') or {})
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Backfill de los atributos tenant_user, tenant_shard, resumen y archivar_en en las compras existentes
+
+Las compras registradas antes del índice tenant_user-fecha-index no tienen el
+atributo 'tenant_user' (tenant_id#user_id) y por lo tanto no aparecen en
+listar_compras; las anteriores al resumen precalculado no tienen 'resumen' y
+las anteriores al archivo frío no tienen el TTL 'archivar_en' (fecha + --dias-hot).
+Este script las recorre con un scan paralelo y completa todos. 'tenant_shard'
+(índice por tenant) se recalcula siempre que no coincida con COMPRAS_TENANT_SHARDS,
+de modo que el script también sirve para cambiar la cantidad de shards.
+
+Las compras con fecha anterior a --dias-hot vencen enseguida: el Lambda de
+streams tiene que estar desplegado antes para que queden archivadas en S3.
+
+Con --tabla-resumen también suma a los agregados por usuario (compras/resumen)
+las compras con fecha anterior a --resumen-hasta, que el consumidor del stream
+(startingPosition LATEST) no vio. La marca por compra_id en --tabla-eventos
+evita contar dos veces las que el stream ya aplicó. Debe correr una sola vez,
+dentro de las 24 h siguientes al despliegue de actualizarResumenUsuarios y con
+--resumen-hasta igual o posterior a ese despliegue.
+
+Uso:
+    python migrar_indice_compras.py --tabla dev-t_MS3_compras --segmentos 8 [--dias-hot 365] [--dry-run]
+    python migrar_indice_compras.py --tabla dev-t_MS3_compras --tabla-resumen dev-t_MS3_resumen_usuarios \
+        --tabla-eventos dev-t_MS3_idempotencia --resumen-hasta "2025-07-20 12:00:00"
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+
+from utils.indice_tenant import shard_tenant
+from utils.resumen_compra import calcular_resumen
+from utils.resumen_usuario import aplicar_compra
+
+
+def archivar_en(fecha, dias_hot):
+    """Epoch en que la compra sale de la tabla, contado desde su fecha"""
+    return int(datetime.strptime(fecha[:19], '%Y-%m-%d %H:%M:%S').timestamp()) + dias_hot * 24 * 60 * 60
+
+
+def procesar_segmento(tabla, segmento, total_segmentos, dias_hot, dry_run, resumen=None):
+    """
+    Procesa un segmento del scan paralelo y devuelve cuántas compras actualizó.
+    'resumen' = (dynamodb, tabla_resumen, tabla_eventos, hasta) activa el
+    backfill de los agregados por usuario
+    """
+    actualizadas = 0
+    kwargs = {
+        'Segment': segmento,
+        'TotalSegments': total_segmentos,
+        'ProjectionExpression': 'compra_id, tenant_id, user_id, productos, resumen, fecha, tenant_user, tenant_shard, archivar_en'
+    }
+
+    while True:
+        respuesta = tabla.scan(**kwargs)
+        for item in respuesta.get('Items', []):
+            if not item.get('tenant_id') or not item.get('user_id'):
+                print(f"⚠️ Compra sin tenant_id/user_id: {item['compra_id']}")
+                continue
+            if resumen and not dry_run and item.get('fecha', '') < resumen[3]:
+                aplicar_compra(resumen[0], resumen[1], resumen[2], item)
+            shard = shard_tenant(item['tenant_id'], item['compra_id'])
+            if item.get('tenant_user') and item.get('resumen') and item.get('archivar_en') and item.get('tenant_shard') == shard:
+                continue
+            actualizadas += 1
+            if not dry_run:
+                tabla.update_item(
+                    Key={'compra_id': item['compra_id']},
+                    UpdateExpression='SET tenant_user = :tu, tenant_shard = :ts, resumen = :r, archivar_en = :a',
+                    ExpressionAttributeValues={
+                        ':tu': f"{item['tenant_id']}#{item['user_id']}",
+                        ':ts': shard,
+                        ':r': item.get('resumen') or calcular_resumen(item.get('productos', [])),
+                        ':a': item.get('archivar_en') or archivar_en(item['fecha'], dias_hot)
+                    }
+                )
+
+        if 'LastEvaluatedKey' not in respuesta:
+            return actualizadas
+        kwargs['ExclusiveStartKey'] = respuesta['LastEvaluatedKey']
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Agrega tenant_user, tenant_shard, resumen y archivar_en a las compras existentes')
+    parser.add_argument('--tabla', default='dev-t_MS3_compras')
+    parser.add_argument('--segmentos', type=int, default=4)
+    parser.add_argument('--dias-hot', type=int, default=365)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--tabla-resumen', help='Tabla de agregados por usuario a completar')
+    parser.add_argument('--tabla-eventos', default='dev-t_MS3_idempotencia')
+    parser.add_argument('--resumen-hasta', help="Fecha 'YYYY-MM-DD HH:MM:SS' del despliegue del consumidor del stream")
+    args = parser.parse_args()
+    if args.tabla_resumen and not args.resumen_hasta:
+        parser.error('--tabla-resumen requiere --resumen-hasta')
+
+    print(f"🚀 Migrando {args.tabla} con {args.segmentos} segmentos{' (dry-run)' if args.dry_run else ''}")
+    dynamodb = boto3.resource('dynamodb')
+    tabla = dynamodb.Table(args.tabla)
+    resumen = None
+    if args.tabla_resumen:
+        resumen = (dynamodb, dynamodb.Table(args.tabla_resumen), dynamodb.Table(args.tabla_eventos), args.resumen_hasta)
+    with ThreadPoolExecutor(max_workers=args.segmentos) as pool:
+        total = sum(pool.map(
+            lambda segmento: procesar_segmento(tabla, segmento, args.segmentos, args.dias_hot, args.dry_run, resumen),
+            range(args.segmentos)
+        ))
+    print(f"✅ Compras actualizadas: {total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Reporte de compras de un tenant usando el índice repartido tenant_shard-fecha-index
+
+Recorre las compras del tenant página a página con consultar_tenant (consulta
+los N shards en paralelo y mezcla por fecha) y muestra totales por mes y los
+productos más vendidos. Con --cursor se retoma desde una página intermedia.
+
+Uso:
+    python reporte_tenant.py --tabla dev-t_MS3_compras --tenant empresa_postman [--desde 2025-01-01] [--hasta 2025-12-31]
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+import boto3
+
+from utils.indice_tenant import codificar_cursor, consultar_tenant, decodificar_cursor
+from utils.resumen_compra import calcular_resumen
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Totales de compras de un tenant')
+    parser.add_argument('--tabla', default='dev-t_MS3_compras')
+    parser.add_argument('--tenant', required=True)
+    parser.add_argument('--desde')
+    parser.add_argument('--hasta')
+    parser.add_argument('--pagina', type=int, default=200)
+    parser.add_argument('--cursor')
+    args = parser.parse_args()
+
+    tabla = boto3.resource('dynamodb').Table(args.tabla)
+    cursor = decodificar_cursor(args.cursor, args.tenant) if args.cursor else None
+    if args.cursor and not cursor:
+        parser.error('cursor inválido para este tenant')
+
+    por_mes = defaultdict(lambda: {'compras': 0, 'total': Decimal('0')})
+    productos = Counter()
+    paginas = 0
+    while True:
+        compras, cursor = consultar_tenant(tabla, args.tenant, args.pagina, cursor, args.desde, args.hasta)
+        paginas += 1
+        for compra in compras:
+            resumen = compra.get('resumen') or calcular_resumen(compra.get('productos', []))
+            mes = por_mes[compra['fecha'][:7]]
+            mes['compras'] += 1
+            mes['total'] += Decimal(str(resumen['total_precio']))
+            for producto in compra.get('productos', []):
+                productos[producto['codigo']] += int(producto['cantidad'])
+        if cursor is None:
+            break
+        if paginas % 50 == 0:
+            print(f"… {paginas} páginas, cursor para retomar: {codificar_cursor(cursor)}")
+
+    print(f"📊 Tenant {args.tenant} ({paginas} páginas)")
+    for mes in sorted(por_mes, reverse=True):
+        print(f"  {mes}: {por_mes[mes]['compras']} compras, {por_mes[mes]['total']} USD")
+    print("🏆 Productos más vendidos:")
+    for codigo, cantidad in productos.most_common(10):
+        print(f"  {codigo}: {cantidad} unidades")
+
+
+if __name__ == "__main__":
+    main()
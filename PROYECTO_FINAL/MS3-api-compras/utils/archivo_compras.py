@@ -0,0 +1,73 @@
+"""
+Lectura del archivo frío de compras en S3
+
+Las compras salen de la tabla por TTL (atributo archivar_en) y el Lambda de
+streams las copia a archivo/{tenant_id}/{user_id}/{fecha_invertida}_{compra_id}.json
+con ComprasS3Manager.archive_compra (lambdas-streams/utils/compras_utils.py).
+Ese servicio se despliega aparte, así que acá se replica solo el formato de la
+clave: la fecha invertida hace que list_objects_v2 devuelva primero las más recientes.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+COMPRAS_ARCHIVO_BUCKET = os.environ.get('COMPRAS_ARCHIVO_BUCKET')
+LECTURAS_PARALELAS = 16
+
+CAMPOS_RESUMEN = ('compra_id', 'fecha', 'resumen')
+
+
+def fecha_invertida(fecha):
+    digitos = ''.join(c for c in fecha if c.isdigit())[:14].ljust(14, '0')
+    return f"{99999999999999 - int(digitos):014d}"
+
+
+def prefijo_usuario(tenant_id, user_id):
+    return f"archivo/{tenant_id}/{user_id}/"
+
+
+def listar_claves(s3, prefijo, start_after=None, limite=None, desde=None, hasta=None):
+    """
+    Claves archivadas del usuario, de la más reciente a la más antigua.
+    Devuelve (claves, hay_mas).
+    """
+    if not start_after and hasta:
+        # Salta las compras posteriores a 'hasta' (fecha invertida menor)
+        start_after = prefijo + fecha_invertida(hasta)
+    tope = prefijo + fecha_invertida(desde) + '~' if desde else None
+
+    claves = []
+    kwargs = {'Bucket': COMPRAS_ARCHIVO_BUCKET, 'Prefix': prefijo}
+    if start_after:
+        kwargs['StartAfter'] = start_after
+    while True:
+        kwargs['MaxKeys'] = min(1000, limite - len(claves)) if limite else 1000
+        respuesta = s3.list_objects_v2(**kwargs)
+        for objeto in respuesta.get('Contents', []):
+            if tope and objeto['Key'] > tope:
+                return claves, False
+            claves.append(objeto['Key'])
+
+        if not respuesta.get('IsTruncated'):
+            return claves, False
+        if limite and len(claves) >= limite:
+            return claves, True
+        kwargs.pop('StartAfter', None)
+        kwargs['ContinuationToken'] = respuesta['NextContinuationToken']
+
+
+def leer_compras(s3, claves, vista='completa'):
+    """Lee los objetos en paralelo conservando el orden de las claves"""
+    def leer(clave):
+        cuerpo = s3.get_object(Bucket=COMPRAS_ARCHIVO_BUCKET, Key=clave)['Body'].read()
+        compra = json.loads(cuerpo, parse_float=Decimal)
+        if vista == 'resumen':
+            compra = {k: compra[k] for k in CAMPOS_RESUMEN if k in compra}
+        return compra
+
+    if not claves:
+        return []
+    with ThreadPoolExecutor(max_workers=min(LECTURAS_PARALELAS, len(claves))) as pool:
+        return list(pool.map(leer, claves))
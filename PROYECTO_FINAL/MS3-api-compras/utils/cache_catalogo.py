@@ -0,0 +1,52 @@
+"""
+Cache por contenedor de los atributos de catálogo (nombre, precio, version)
+
+registrar_compra solo necesita leer el producto para copiar nombre y precio,
+que casi nunca cambian; el stock lo verifica la condición de la transacción.
+Las entradas viven CATALOGO_CACHE_TTL segundos y se invalidan antes si la
+transacción detecta que la 'version' del producto cambió.
+"""
+
+import os
+import time
+from collections import OrderedDict
+
+CATALOGO_CACHE_TTL = int(os.environ.get('CATALOGO_CACHE_TTL', '300'))
+CATALOGO_CACHE_MAX = int(os.environ.get('CATALOGO_CACHE_MAX', '2048'))
+
+ATRIBUTOS = ('codigo', 'nombre', 'precio', 'version', 'shards')
+
+_catalogo = OrderedDict()  # codigo -> (atributos, vence_en)
+_stats = {'hits': 0, 'misses': 0, 'invalidaciones': 0}
+
+
+def obtener(codigo):
+    """Atributos de catálogo cacheados del producto, o None si no hay entrada vigente"""
+    entrada = _catalogo.get(codigo)
+    if entrada is None or entrada[1] <= time.time():
+        if entrada is not None:
+            del _catalogo[codigo]
+        _stats['misses'] += 1
+        return None
+    _catalogo.move_to_end(codigo)
+    _stats['hits'] += 1
+    return entrada[0]
+
+
+def guardar(item):
+    """Guarda los atributos de catálogo de un producto recién leído de la tabla"""
+    atributos = {k: item[k] for k in ATRIBUTOS if k in item}
+    _catalogo[item['codigo']] = (atributos, time.time() + CATALOGO_CACHE_TTL)
+    _catalogo.move_to_end(item['codigo'])
+    while len(_catalogo) > CATALOGO_CACHE_MAX:
+        _catalogo.popitem(last=False)
+
+
+def invalidar(codigo):
+    if _catalogo.pop(codigo, None) is not None:
+        _stats['invalidaciones'] += 1
+
+
+def stats():
+    """Contadores del cache de catálogo del contenedor"""
+    return dict(_stats, size=len(_catalogo), max_size=CATALOGO_CACHE_MAX)
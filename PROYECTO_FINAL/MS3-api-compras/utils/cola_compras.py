@@ -0,0 +1,58 @@
+"""
+Cola de pedidos de compra para el modo asíncrono (202 Accepted)
+
+COLA_COMPRAS elige la implementación:
+- 'sqs' (por defecto): cola SQS indicada en COMPRAS_QUEUE_URL
+- 'memoria': cola local en memoria, para probar el pipeline sin AWS
+"""
+
+import json
+import os
+from collections import deque
+
+import boto3
+
+
+class ColaSQS:
+    def __init__(self, url):
+        self.url = url
+        self.sqs = boto3.client('sqs')
+
+    def enviar(self, pedido):
+        self.sqs.send_message(QueueUrl=self.url, MessageBody=json.dumps(pedido))
+
+
+class ColaMemoria:
+    """Stand-in local: guarda los pedidos serializados igual que SQS"""
+
+    def __init__(self):
+        self.mensajes = deque()
+
+    def enviar(self, pedido):
+        self.mensajes.append(json.dumps(pedido))
+
+    def recibir(self, maximo=10):
+        pedidos = []
+        while self.mensajes and len(pedidos) < maximo:
+            pedidos.append(json.loads(self.mensajes.popleft()))
+        return pedidos
+
+
+_cola = None
+
+
+def obtener_cola():
+    """Cola del contenedor, creada la primera vez según COLA_COMPRAS"""
+    global _cola
+    if _cola is None:
+        if os.environ.get('COLA_COMPRAS', 'sqs') == 'memoria':
+            _cola = ColaMemoria()
+        else:
+            _cola = ColaSQS(os.environ['COMPRAS_QUEUE_URL'])
+    return _cola
+
+
+def usar_cola(cola):
+    """Reemplaza la cola del contenedor (por ejemplo por una ColaMemoria en pruebas)"""
+    global _cola
+    _cola = cola
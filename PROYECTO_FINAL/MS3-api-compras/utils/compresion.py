@@ -0,0 +1,92 @@
+"""
+Compresión de respuestas negociada con Accept-Encoding
+
+Las respuestas comprimidas viajan en base64 con isBase64Encoded=True; el API
+declara sus Content-Type en binaryMediaTypes para que API Gateway las entregue
+como binario. API Gateway solo decodifica el base64 cuando el primer tipo del
+Accept del request está en binaryMediaTypes; si no (p. ej. Accept: */* del
+front), se responde sin comprimir. Por lo mismo los bodies de esos tipos llegan
+en base64: los handlers los leen con leer_body.
+'br' se ofrece solo si el paquete brotli está instalado en el contenedor.
+"""
+
+import base64
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Por debajo de este tamaño comprimir cuesta más de lo que ahorra
+COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', '1024'))
+
+# Deben coincidir con provider.apiGateway.binaryMediaTypes de serverless.yml
+BINARY_MEDIA_TYPES = {'application/json', 'application/x-ndjson'}
+
+
+def obtener_header(event, nombre):
+    """Valor de un header del request sin distinguir mayúsculas"""
+    for clave, valor in (event.get('headers') or {}).items():
+        if clave.lower() == nombre.lower():
+            return valor
+    return None
+
+
+def acepta_binario(event):
+    """True si API Gateway entregará como binario la respuesta (primer tipo del Accept)"""
+    accept = obtener_header(event, 'Accept') or ''
+    primero = accept.split(',')[0].partition(';')[0].strip().lower()
+    return primero in BINARY_MEDIA_TYPES
+
+
+def leer_body(event):
+    """Body del request como texto, decodificando el base64 de binaryMediaTypes"""
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def negociar(accept_encoding):
+    """Codificación a usar según Accept-Encoding: 'br', 'gzip' o None"""
+    aceptadas = {}
+    for parte in (accept_encoding or '').split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        calidad = 1.0
+        if parametros.strip().startswith('q='):
+            try:
+                calidad = float(parametros.strip()[2:])
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre.strip().lower()] = calidad
+
+    candidatas = ['br', 'gzip'] if brotli else ['gzip']
+    candidatas = [c for c in candidatas if aceptadas.get(c, aceptadas.get('*', 0)) > 0]
+    if not candidatas:
+        return None
+    return max(candidatas, key=lambda c: aceptadas.get(c, aceptadas.get('*', 0)))
+
+
+def responder(event, status_code, headers, cuerpo):
+    """Respuesta lambda-proxy con el cuerpo comprimido si el cliente lo acepta y vale la pena"""
+    headers = dict(headers, Vary='Accept-Encoding')
+    datos = cuerpo.encode('utf-8')
+    codificacion = None
+    if len(datos) >= COMPRESION_MIN_BYTES and acepta_binario(event):
+        codificacion = negociar(obtener_header(event, 'Accept-Encoding'))
+    if not codificacion:
+        return {'statusCode': status_code, 'headers': headers, 'body': cuerpo}
+
+    if codificacion == 'br':
+        comprimido = brotli.compress(datos, quality=5)
+    else:
+        comprimido = gzip.compress(datos, compresslevel=6)
+    headers['Content-Encoding'] = codificacion
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': base64.b64encode(comprimido).decode('ascii'),
+        'isBase64Encoded': True
+    }
@@ -0,0 +1,72 @@
+"""
+Escritura de un export NDJSON con memoria acotada
+
+Las líneas se acumulan hasta EXPORTE_INLINE_MAX_BYTES: si el historial entra,
+se devuelve en el mismo response. Si lo supera, se pasa a una subida multiparte
+a S3 en partes de EXPORTE_PARTE_BYTES y el cliente recibe una URL prefirmada;
+en memoria nunca hay más de una parte.
+"""
+
+import os
+
+EXPORTE_INLINE_MAX_BYTES = int(os.environ.get('EXPORTE_INLINE_MAX_BYTES', str(1024 * 1024)))
+EXPORTE_PARTE_BYTES = max(int(os.environ.get('EXPORTE_PARTE_BYTES', str(8 * 1024 * 1024))), 5 * 1024 * 1024)  # mínimo de S3
+EXPORTE_URL_TTL = int(os.environ.get('EXPORTE_URL_TTL', '900'))
+
+CONTENT_TYPE = 'application/x-ndjson'
+
+
+class ExportacionNDJSON:
+    def __init__(self, s3, bucket, key, inline_max=EXPORTE_INLINE_MAX_BYTES, parte_bytes=EXPORTE_PARTE_BYTES):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.inline_max = inline_max
+        self.parte_bytes = parte_bytes
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.partes = []
+        self.lineas = 0
+
+    def escribir(self, linea):
+        self.buffer += linea.encode('utf-8') + b'\n'
+        self.lineas += 1
+        if self.upload_id is None and len(self.buffer) > self.inline_max:
+            respuesta = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=CONTENT_TYPE, ServerSideEncryption='AES256'
+            )
+            self.upload_id = respuesta['UploadId']
+        if self.upload_id is not None and len(self.buffer) >= self.parte_bytes:
+            self._subir_parte()
+
+    def _subir_parte(self):
+        numero = len(self.partes) + 1
+        respuesta = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=numero, Body=bytes(self.buffer)
+        )
+        self.partes.append({'PartNumber': numero, 'ETag': respuesta['ETag']})
+        self.buffer = bytearray()
+
+    @property
+    def en_s3(self):
+        return self.upload_id is not None
+
+    def cerrar(self):
+        """Completa el export: devuelve el NDJSON si quedó inline o la URL prefirmada del objeto"""
+        if not self.en_s3:
+            return {'ndjson': self.buffer.decode('utf-8')}
+
+        if self.buffer or not self.partes:
+            self._subir_parte()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': self.partes}
+        )
+        url = self.s3.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self.key}, ExpiresIn=EXPORTE_URL_TTL
+        )
+        return {'url': url, 'expira_en': EXPORTE_URL_TTL}
+
+    def abortar(self):
+        # Sin abortar, las partes ya subidas se siguen cobrando hasta la regla de lifecycle
+        if self.en_s3:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
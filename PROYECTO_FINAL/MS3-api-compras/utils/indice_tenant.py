@@ -0,0 +1,114 @@
+"""
+Índice de compras por tenant con escrituras repartidas en shards
+
+Cada compra lleva tenant_shard = '{tenant_id}#{n}', con n = crc32(compra_id) % N,
+así un tenant grande escribe sobre N particiones del índice tenant_shard-fecha-index
+en lugar de una. Para leer, consultar_tenant consulta los N shards en paralelo
+y mezcla los resultados por fecha (más recientes primero); el cursor guarda la
+posición de cada shard.
+
+COMPRAS_TENANT_SHARDS no puede cambiarse sin volver a calcular tenant_shard en
+las compras existentes (migrar_indice_compras.py).
+"""
+
+import base64
+import heapq
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+INDICE_TENANT = 'tenant_shard-fecha-index'
+TENANT_SHARDS = int(os.environ.get('COMPRAS_TENANT_SHARDS', '8'))
+
+FIN = 'fin'  # shard ya recorrido por completo
+
+
+def shard_tenant(tenant_id, compra_id, shards=TENANT_SHARDS):
+    return f"{tenant_id}#{zlib.crc32(compra_id.encode()) % shards}"
+
+
+def codificar_cursor(posiciones):
+    return base64.urlsafe_b64encode(json.dumps(posiciones).encode()).decode()
+
+
+def decodificar_cursor(cursor, tenant_id, shards=TENANT_SHARDS):
+    """Posiciones por shard del cursor, o None si no corresponde a este tenant"""
+    try:
+        posiciones = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(posiciones, dict) or set(posiciones) != {str(n) for n in range(shards)}:
+        return None
+    for posicion in posiciones.values():
+        if posicion not in (None, FIN) and (not isinstance(posicion, dict) or not posicion.get('tenant_shard', '').startswith(f'{tenant_id}#')):
+            return None
+    return posiciones
+
+
+def _orden(item):
+    return (item['fecha'], item['compra_id'])
+
+
+def _posicion(item):
+    # ExclusiveStartKey de un índice: clave de la tabla + clave del índice
+    return {'compra_id': item['compra_id'], 'tenant_shard': item['tenant_shard'], 'fecha': item['fecha']}
+
+
+def consultar_tenant(tabla, tenant_id, limit=100, cursor=None, desde=None, hasta=None, shards=TENANT_SHARDS):
+    """
+    Una página de compras del tenant, de la más reciente a la más antigua.
+    Devuelve (compras, posiciones para la página siguiente o None si no hay más).
+    """
+    posiciones = dict(cursor) if cursor else {str(n): None for n in range(shards)}
+
+    def consultar(shard):
+        condicion = Key('tenant_shard').eq(f'{tenant_id}#{shard}')
+        if desde and hasta:
+            condicion &= Key('fecha').between(desde, hasta)
+        elif desde:
+            condicion &= Key('fecha').gte(desde)
+        elif hasta:
+            condicion &= Key('fecha').lte(hasta)
+        kwargs = {'IndexName': INDICE_TENANT, 'KeyConditionExpression': condicion, 'ScanIndexForward': False, 'Limit': limit}
+        if posiciones[shard]:
+            kwargs['ExclusiveStartKey'] = posiciones[shard]
+        respuesta = tabla.query(**kwargs)
+        return shard, respuesta.get('Items', []), respuesta.get('LastEvaluatedKey')
+
+    activos = [shard for shard, posicion in posiciones.items() if posicion != FIN]
+    if not activos:
+        return [], None
+    with ThreadPoolExecutor(max_workers=len(activos)) as pool:
+        resultados = list(pool.map(consultar, activos))
+
+    # Un shard con más páginas puede tener compras más nuevas que las de otro shard
+    # posteriores a su último ítem leído: solo se emite hasta esa frontera
+    fronteras = [_orden(items[-1]) if items else None for _, items, siguiente in resultados if siguiente]
+    # Un shard con más páginas pero sin ítems leídos no deja emitir nada en esta página
+    bloqueada = None in fronteras
+    frontera = max(fronteras) if fronteras and not bloqueada else None
+
+    mezcla = heapq.merge(
+        *[[(shard, item) for item in items] for shard, items, _ in resultados],
+        key=lambda par: _orden(par[1]), reverse=True
+    )
+    compras, consumidos = [], {}
+    for shard, item in mezcla:
+        if bloqueada or len(compras) >= limit or (frontera and _orden(item) < frontera):
+            break
+        compras.append(item)
+        consumidos[shard] = consumidos.get(shard, 0) + 1
+
+    for shard, items, siguiente in resultados:
+        usados = consumidos.get(shard, 0)
+        if usados == len(items):
+            posiciones[shard] = siguiente or FIN
+        elif usados:
+            posiciones[shard] = _posicion(items[usados - 1])
+
+    if all(posicion == FIN for posicion in posiciones.values()):
+        return compras, None
+    return compras, posiciones
@@ -0,0 +1,18 @@
+"""
+Totales de una compra calculados al registrarla
+
+Se guardan en el atributo 'resumen' con aritmética Decimal exacta, para que
+listar_compras (vista=resumen), el stream a S3 y los clientes no tengan que
+recalcularlos a partir de la lista de productos.
+"""
+
+from decimal import Decimal
+
+
+def calcular_resumen(productos):
+    return {
+        'total_productos': len(productos),
+        'total_cantidad': sum(int(p['cantidad']) for p in productos),
+        'total_precio': sum((Decimal(str(p['precio_unitario'])) * int(p['cantidad']) for p in productos), Decimal('0')),
+        'moneda': 'USD'
+    }
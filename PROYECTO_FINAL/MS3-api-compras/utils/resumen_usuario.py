@@ -0,0 +1,113 @@
+"""
+Agregados de compras por usuario (tabla RESUMEN_USUARIOS_TABLE, clave tenant_user)
+
+Cada ítem acumula cantidad de compras, total gastado, última compra y las
+unidades compradas por producto (un atributo 'producto#<codigo>' por producto,
+para poder sumarlas con ADD). Se mantienen desde el stream de la tabla de
+compras; las compras anteriores al consumidor del stream las suma
+migrar_indice_compras.py --tabla-resumen. compras/resumen los lee con un solo
+get_item.
+"""
+
+import os
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+from utils.resumen_compra import calcular_resumen
+
+PREFIJO_PRODUCTO = 'producto#'
+TOP_PRODUCTOS = int(os.environ.get('RESUMEN_TOP_PRODUCTOS', '5'))
+
+# Una compra aplicada se recuerda mientras el stream puede reentregarla (retención
+# de 24 h); el backfill tiene que correr dentro de ese plazo tras el despliegue
+EVENTO_TTL = 24 * 60 * 60
+
+serializer = TypeSerializer()
+
+
+def operacion_agregado(tabla, compra):
+    """Update que suma una compra al agregado de su usuario"""
+    resumen = compra.get('resumen') or calcular_resumen(compra.get('productos', []))
+    nombres = {}
+    valores = {':uno': 1, ':total': Decimal(str(resumen['total_precio'])), ':tenant': compra['tenant_id'], ':user': compra['user_id']}
+    sumas = ['compras :uno', 'total_gastado :total']
+    for i, producto in enumerate(compra.get('productos', [])):
+        nombres[f'#p{i}'] = PREFIJO_PRODUCTO + producto['codigo']
+        valores[f':p{i}'] = int(producto['cantidad'])
+        sumas.append(f'#p{i} :p{i}')
+
+    operacion = {
+        'TableName': tabla.name,
+        'Key': {'tenant_user': serializer.serialize(f"{compra['tenant_id']}#{compra['user_id']}")},
+        'UpdateExpression': 'SET tenant_id = :tenant, user_id = :user ADD ' + ', '.join(sumas),
+        'ExpressionAttributeValues': {k: serializer.serialize(v) for k, v in valores.items()}
+    }
+    if nombres:
+        operacion['ExpressionAttributeNames'] = nombres
+    return operacion
+
+
+def aplicar_compra(dynamodb, tabla, tabla_eventos, compra):
+    """
+    Suma la compra al agregado una sola vez por compra_id: la marca y la suma
+    van en la misma transacción. La marca es por compra y no por eventID para
+    que el stream y el backfill no cuenten dos veces la misma compra. Devuelve
+    False si la compra ya se había aplicado (reentrega del stream o backfill).
+    """
+    aplicada = True
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=[
+            {
+                'Put': {
+                    'TableName': tabla_eventos.name,
+                    'Item': {
+                        'clave': {'S': f"resumen#{compra['compra_id']}"},
+                        'expires': {'N': str(int(time.time()) + EVENTO_TTL)}
+                    },
+                    'ConditionExpression': 'attribute_not_exists(clave)'
+                }
+            },
+            {'Update': operacion_agregado(tabla, compra)}
+        ])
+    except ClientError as e:
+        razones = e.response.get('CancellationReasons') or [{}]
+        if e.response['Error']['Code'] != 'TransactionCanceledException' or razones[0].get('Code') != 'ConditionalCheckFailed':
+            raise
+        aplicada = False
+
+    # La última compra es un máximo: reaplicarla o recibirla fuera de orden no la
+    # altera. Va también en las reentregas, por si falló después de la transacción
+    try:
+        tabla.update_item(
+            Key={'tenant_user': f"{compra['tenant_id']}#{compra['user_id']}"},
+            UpdateExpression='SET ultima_compra = :f, ultima_compra_id = :id',
+            ConditionExpression='attribute_not_exists(ultima_compra) OR ultima_compra < :f',
+            ExpressionAttributeValues={':f': compra['fecha'], ':id': compra['compra_id']}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    return aplicada
+
+
+def formatear(item, top=TOP_PRODUCTOS):
+    """Respuesta de compras/resumen a partir del ítem agregado (o None si no compró)"""
+    if not item:
+        return {'compras': 0, 'total_gastado': 0, 'moneda': 'USD', 'ultima_compra': None, 'ultima_compra_id': None, 'top_productos': []}
+
+    productos = [
+        {'codigo': k[len(PREFIJO_PRODUCTO):], 'cantidad': int(v)}
+        for k, v in item.items() if k.startswith(PREFIJO_PRODUCTO)
+    ]
+    productos.sort(key=lambda p: (-p['cantidad'], p['codigo']))
+    return {
+        'compras': int(item.get('compras', 0)),
+        'total_gastado': item.get('total_gastado', Decimal('0')),
+        'moneda': 'USD',
+        'ultima_compra': item.get('ultima_compra'),
+        'ultima_compra_id': item.get('ultima_compra_id'),
+        'top_productos': productos[:top]
+    }
@@ -0,0 +1,255 @@
+"""
+Inventario por shards para productos muy demandados (ventas flash)
+
+Un producto con el atributo 'shards' = N reparte su stock en N items de la
+tabla STOCK_SHARDS_TABLE. La clave de partición de cada shard es 'codigo#i'
+(shard_id), así cada shard vive en su propia partición. Cada compra descuenta
+de un shard elegido al azar que tenga stock suficiente, de modo que las
+escrituras condicionales se reparten entre N particiones en lugar de
+concentrarse en una sola.
+
+El atributo 'cantidad' del producto en t_MS2_productos sigue siendo la vista
+agregada que leen los clientes; la publica el rebalanceo periódico
+(publicar_total). Por eso MS2 no acepta cambios de 'cantidad' en productos
+sharded: la reposición se hace con reponer(), que suma sobre un shard.
+
+Los productos sharded se registran en el ítem REGISTRO_SHARDED de la misma
+tabla, así el rebalanceo no necesita escanear t_MS2_productos.
+"""
+
+import random
+import time
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+serializer = TypeSerializer()
+
+MAX_REINTENTOS = 5  # reintentos para UnprocessedKeys de batch_get_item
+
+# shard_id del ítem con el conjunto 'codigos' de productos sharded (no choca con
+# 'codigo#i' porque i siempre es numérico)
+REGISTRO_SHARDED = 'registro#productos'
+
+
+def es_sharded(producto):
+    return int(producto.get('shards', 0) or 0) > 0
+
+
+def clave_shard(codigo, shard):
+    """shard_id de un shard: una partición por shard"""
+    return f'{codigo}#{shard}'
+
+
+def leer_shards(shards_table, codigo, n):
+    """Devuelve {shard: cantidad} de los n shards del producto con lectura consistente"""
+    solicitud = {shards_table.name: {
+        'Keys': [{'shard_id': {'S': clave_shard(codigo, i)}} for i in range(n)],
+        'ConsistentRead': True
+    }}
+    shards = {}
+    for intento in range(MAX_REINTENTOS + 1):
+        respuesta = shards_table.meta.client.batch_get_item(RequestItems=solicitud)
+        for item in respuesta.get('Responses', {}).get(shards_table.name, []):
+            shards[int(item['shard']['N'])] = int(item['cantidad']['N'])
+        solicitud = respuesta.get('UnprocessedKeys') or {}
+        if not solicitud:
+            return shards
+        if intento < MAX_REINTENTOS:
+            time.sleep(0.05 * (2 ** intento))
+    raise RuntimeError(f'No se pudieron leer los shards de {codigo}')
+
+
+def elegir_shards(shards, cantidad):
+    """
+    Reparte la cantidad a descontar entre los shards.
+    Prefiere un único shard al azar con stock suficiente; si ninguno alcanza,
+    combina varios empezando por uno al azar. Devuelve {shard: cantidad} o
+    None si el stock total no alcanza.
+    """
+    con_capacidad = [s for s, disponible in shards.items() if disponible >= cantidad]
+    if con_capacidad:
+        return {random.choice(con_capacidad): cantidad}
+
+    if sum(shards.values()) < cantidad:
+        return None
+
+    orden = list(shards)
+    inicio = random.randrange(len(orden))
+    asignacion = {}
+    restante = cantidad
+    for shard in orden[inicio:] + orden[:inicio]:
+        tomar = min(restante, shards[shard])
+        if tomar > 0:
+            asignacion[shard] = tomar
+            restante -= tomar
+        if restante == 0:
+            break
+    return asignacion
+
+
+def operaciones_descuento(shards_table_name, codigo, asignacion):
+    """Operaciones TransactWriteItems con el descuento condicional de cada shard"""
+    return [{
+        'Update': {
+            'TableName': shards_table_name,
+            'Key': {'shard_id': {'S': clave_shard(codigo, shard)}},
+            'UpdateExpression': 'SET cantidad = cantidad - :c',
+            'ConditionExpression': 'cantidad >= :c',
+            'ExpressionAttributeValues': {':c': serializer.serialize(cantidad)}
+        }
+    } for shard, cantidad in asignacion.items()]
+
+
+def productos_sharded(shards_table):
+    """Códigos registrados como sharded (lectura consistente del registro)"""
+    item = shards_table.get_item(Key={'shard_id': REGISTRO_SHARDED}, ConsistentRead=True).get('Item') or {}
+    return sorted(item.get('codigos', set()))
+
+
+def registrar_sharded(shards_table, codigos):
+    """Agrega códigos al registro (productos sharded antes de existir el registro)"""
+    if codigos:
+        shards_table.update_item(
+            Key={'shard_id': REGISTRO_SHARDED},
+            UpdateExpression='ADD codigos :c',
+            ExpressionAttributeValues={':c': set(codigos)}
+        )
+
+
+def quitar_sharded(shards_table, codigo):
+    """Saca del registro un producto eliminado o que ya no es sharded"""
+    shards_table.update_item(
+        Key={'shard_id': REGISTRO_SHARDED},
+        UpdateExpression='DELETE codigos :c',
+        ExpressionAttributeValues={':c': {codigo}}
+    )
+
+
+def _repartir(total, n):
+    base, resto = divmod(total, n)
+    return [base + (1 if i < resto else 0) for i in range(n)]
+
+
+def habilitar_sharding(dynamodb, productos_table, shards_table, codigo, n):
+    """Reparte el stock actual del producto en n shards y lo marca como sharded"""
+    if not 1 <= n <= 98:
+        # TransactWriteItems admite 100 operaciones: n shards + el producto + el registro
+        raise ValueError('El número de shards debe estar entre 1 y 98')
+
+    producto = productos_table.get_item(Key={'codigo': codigo}, ConsistentRead=True)['Item']
+    if es_sharded(producto):
+        raise ValueError(f'El producto {codigo} ya tiene stock por shards')
+
+    cantidad = int(producto.get('cantidad', 0))
+    operaciones = [{
+        'Update': {
+            'TableName': productos_table.name,
+            'Key': {'codigo': {'S': codigo}},
+            # Nueva 'version': las compras que tienen el producto cacheado como no
+            # sharded fallan la condición de versión y lo releen
+            'UpdateExpression': 'SET shards = :n, #v = if_not_exists(#v, :cero) + :uno',
+            'ConditionExpression': 'cantidad = :c AND attribute_not_exists(shards)',
+            'ExpressionAttributeNames': {'#v': 'version'},
+            'ExpressionAttributeValues': {
+                ':n': {'N': str(n)}, ':c': {'N': str(cantidad)}, ':cero': {'N': '0'}, ':uno': {'N': '1'}
+            }
+        }
+    }]
+    operaciones += [{
+        'Put': {
+            'TableName': shards_table.name,
+            'Item': {
+                'shard_id': {'S': clave_shard(codigo, i)},
+                'codigo': {'S': codigo},
+                'shard': {'N': str(i)},
+                'cantidad': {'N': str(parte)}
+            }
+        }
+    } for i, parte in enumerate(_repartir(cantidad, n))]
+    operaciones.append({
+        'Update': {
+            'TableName': shards_table.name,
+            'Key': {'shard_id': {'S': REGISTRO_SHARDED}},
+            'UpdateExpression': 'ADD codigos :c',
+            'ExpressionAttributeValues': {':c': {'SS': [codigo]}}
+        }
+    })
+    dynamodb.meta.client.transact_write_items(TransactItems=operaciones)
+
+
+def publicar_total(productos_table, shards_table, codigo, n, actual=None):
+    """
+    Publica en el producto la suma de sus shards (lectura consistente) con un
+    SET simple, sin depender de que los shards no cambien. No escribe si el
+    total no cambió, para no generar un MODIFY por ejecución en el stream de
+    productos. Devuelve (total, escrito).
+    """
+    total = sum(leer_shards(shards_table, codigo, n).values())
+    if actual is not None and int(actual) == total:
+        return total, False
+    try:
+        productos_table.update_item(
+            Key={'codigo': codigo},
+            UpdateExpression='SET cantidad = :total',
+            # attribute_exists(shards): no recrear un producto borrado en MS2
+            ConditionExpression='attribute_exists(shards) AND (attribute_not_exists(cantidad) OR cantidad <> :total)',
+            ExpressionAttributeValues={':total': total}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return total, False
+    return total, True
+
+
+def rebalancear(dynamodb, shards_table, codigo, n):
+    """
+    Redistribuye el stock de los shards en partes iguales. Usa control
+    optimista: si alguna compra descuenta un shard entre la lectura y la
+    escritura, la transacción se cancela y se reintenta en la próxima
+    ejecución. El total del producto lo publica publicar_total aparte, así que
+    una cancelación no lo deja desactualizado. Devuelve False si los shards ya
+    estaban balanceados (no escribe).
+    """
+    shards = leer_shards(shards_table, codigo, n)
+    for i in range(n):
+        shards.setdefault(i, 0)
+    if max(shards.values()) - min(shards.values()) <= 1:
+        return False
+    total = sum(shards.values())
+    objetivo = dict(zip(sorted(shards), _repartir(total, len(shards))))
+
+    operaciones = []
+    for shard, nueva in objetivo.items():
+        operaciones.append({
+            'Update': {
+                'TableName': shards_table.name,
+                'Key': {'shard_id': {'S': clave_shard(codigo, shard)}},
+                'UpdateExpression': 'SET cantidad = :nueva, codigo = :codigo, shard = :shard',
+                'ConditionExpression': 'attribute_not_exists(cantidad) OR cantidad = :actual',
+                'ExpressionAttributeValues': {
+                    ':nueva': {'N': str(nueva)},
+                    ':actual': {'N': str(shards[shard])},
+                    ':codigo': {'S': codigo},
+                    ':shard': {'N': str(shard)}
+                }
+            }
+        })
+    dynamodb.meta.client.transact_write_items(TransactItems=operaciones)
+    return True
+
+
+def reponer(shards_table, codigo, n, cantidad):
+    """
+    Suma stock a un producto sharded (en un shard al azar). El próximo
+    rebalanceo lo reparte y publica el nuevo total en el producto.
+    """
+    if cantidad <= 0:
+        raise ValueError('La cantidad a reponer debe ser positiva')
+    shards_table.update_item(
+        Key={'shard_id': clave_shard(codigo, random.randrange(n))},
+        UpdateExpression='ADD cantidad :c',
+        ConditionExpression='attribute_exists(shard_id)',
+        ExpressionAttributeValues={':c': cantidad}
+    )
@@ -7,8 +7,9 @@ import json
 import boto3
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -17,6 +18,10 @@ from urllib3.util.retry import Retry
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Registros de productos distintos se procesan en paralelo; los de un mismo
+# codigo, en orden y en el mismo worker
+STREAM_PARALLELISM = int(os.environ.get('STREAM_PARALLELISM', '8'))
+
 class ElasticSearchManager:
     """Gestiona las operaciones con ElasticSearch por tenant"""
     
@@ -43,7 +48,8 @@ class ElasticSearchManager:
             backoff_factor=1,
             status_forcelist=[429, 500, 502, 503, 504],
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Una conexión por worker hacia cada endpoint
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=max(STREAM_PARALLELISM, 10))
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
@@ -160,77 +166,55 @@ class ElasticSearchManager:
             logger.error(f"❌ Error eliminando producto: {e}")
             return False
 
-def process_dynamodb_record(record: Dict[str, Any], es_manager: ElasticSearchManager) -> bool:
-    """Procesa un registro individual de DynamoDB Stream"""
+def process_dynamodb_record(record: Dict[str, Any], es_manager: ElasticSearchManager) -> Dict[str, Any]:
+    """
+    Procesa un registro individual de DynamoDB Stream
+    
+    Returns:
+        Dict con 'success' y 'retry': retry=False marca los fallos permanentes
+        (tenant sin endpoint, registro sin codigo o mal formado), que un
+        reintento no resolvería y no se reportan en batchItemFailures
+    """
+    event_name = record.get('eventName')
+    if event_name not in ('INSERT', 'MODIFY', 'REMOVE'):
+        logger.warning(f"⚠️ Evento no reconocido: {event_name}")
+        return {'success': True}
+    
     try:
-        event_name = record.get('eventName')
+        # INSERT/MODIFY indexan la imagen nueva; REMOVE borra según la anterior
+        image = 'OldImage' if event_name == 'REMOVE' else 'NewImage'
+        product_data = parse_dynamodb_item(record.get('dynamodb', {}).get(image, {}))
+    except Exception as e:
+        logger.error(f"❌ Registro DynamoDB mal formado: {e}")
+        return {'success': False, 'retry': False}
+    
+    tenant_id = product_data.get('tenant_id', 'default')
+    endpoint = es_manager.get_endpoint(tenant_id)
+    if not endpoint:
+        logger.error(f"❌ No se encontró endpoint para tenant: {tenant_id}")
+        return {'success': False, 'retry': False}
+    
+    product_id = product_data.get('codigo')
+    if not product_id:
+        logger.error(f"❌ No se encontró código de producto ({event_name})")
+        return {'success': False, 'retry': False}
+    
+    try:
+        if not es_manager.health_check(endpoint):
+            logger.error(f"❌ ElasticSearch no disponible en {endpoint}")
+            return {'success': False, 'retry': True}
         
         if event_name == 'INSERT':
-            # Nuevo producto
-            new_image = record.get('dynamodb', {}).get('NewImage', {})
-            product_data = parse_dynamodb_item(new_image)
-            
-            tenant_id = product_data.get('tenant_id', 'default')
-            endpoint = es_manager.get_endpoint(tenant_id)
-            
-            if not endpoint:
-                logger.error(f"❌ No se encontró endpoint para tenant: {tenant_id}")
-                return False
-            
-            if not es_manager.health_check(endpoint):
-                logger.error(f"❌ ElasticSearch no disponible en {endpoint}")
-                return False
-            
-            return es_manager.index_product(endpoint, product_data)
-        
+            ok = es_manager.index_product(endpoint, product_data)
         elif event_name == 'MODIFY':
-            # Producto modificado
-            new_image = record.get('dynamodb', {}).get('NewImage', {})
-            product_data = parse_dynamodb_item(new_image)
-            
-            tenant_id = product_data.get('tenant_id', 'default')
-            endpoint = es_manager.get_endpoint(tenant_id)
-            
-            if not endpoint:
-                logger.error(f"❌ No se encontró endpoint para tenant: {tenant_id}")
-                return False
-            
-            if not es_manager.health_check(endpoint):
-                logger.error(f"❌ ElasticSearch no disponible en {endpoint}")
-                return False
-            
-            return es_manager.update_product(endpoint, product_data)
-        
-        elif event_name == 'REMOVE':
-            # Producto eliminado
-            old_image = record.get('dynamodb', {}).get('OldImage', {})
-            product_data = parse_dynamodb_item(old_image)
-            
-            tenant_id = product_data.get('tenant_id', 'default')
-            endpoint = es_manager.get_endpoint(tenant_id)
-            
-            if not endpoint:
-                logger.error(f"❌ No se encontró endpoint para tenant: {tenant_id}")
-                return False
-            
-            if not es_manager.health_check(endpoint):
-                logger.error(f"❌ ElasticSearch no disponible en {endpoint}")
-                return False
-            
-            product_id = product_data.get('codigo')
-            if product_id:
-                return es_manager.delete_product(endpoint, product_id)
-            else:
-                logger.error("❌ No se encontró código de producto para eliminar")
-                return False
-        
+            ok = es_manager.update_product(endpoint, product_data)
         else:
-            logger.warning(f"⚠️ Evento no reconocido: {event_name}")
-            return True
+            ok = es_manager.delete_product(endpoint, product_id)
+        return {'success': ok, 'retry': True}
             
     except Exception as e:
         logger.error(f"❌ Error procesando registro DynamoDB: {e}")
-        return False
+        return {'success': False, 'retry': True}
 
 def parse_dynamodb_item(item: Dict[str, Any]) -> Dict[str, Any]:
     """Parse DynamoDB item format to Python dict"""
@@ -253,36 +237,72 @@ def parse_dynamodb_item(item: Dict[str, Any]) -> Dict[str, Any]:
     
     return result
 
+def record_key(record: Dict[str, Any]) -> str:
+    """Clave de orden del registro: el codigo del producto (clave de la tabla)"""
+    keys = record.get('dynamodb', {}).get('Keys', {})
+    return keys.get('codigo', {}).get('S') or record.get('eventID', '')
+
+def process_records(records: List[Dict[str, Any]], es_manager: ElasticSearchManager) -> List[Dict[str, Any]]:
+    """
+    Procesa los registros con hasta STREAM_PARALLELISM workers. Los registros
+    de un mismo codigo forman una cadena que un solo worker recorre en el orden
+    del stream, así un REMOVE nunca se adelanta al INSERT/MODIFY previo. Si un
+    registro falla, los siguientes de su cadena no se aplican y quedan como
+    fallidos para reintentarse detrás de él; tras un fallo permanente
+    (retry=False) la cadena sigue.
+    
+    Returns:
+        Lista con el resultado (process_dynamodb_record) de cada registro, en el orden recibido
+    """
+    cadenas: Dict[str, List[int]] = {}
+    for i, record in enumerate(records):
+        cadenas.setdefault(record_key(record), []).append(i)
+    
+    resultados = [{'success': False, 'retry': True} for _ in records]
+    
+    def procesar_cadena(indices: List[int]) -> None:
+        for i in indices:
+            try:
+                resultados[i] = process_dynamodb_record(records[i], es_manager)
+            except Exception as e:
+                logger.error(f"❌ Error procesando registro: {e}")
+                resultados[i] = {'success': False, 'retry': True}
+            if not resultados[i]['success'] and resultados[i].get('retry', True):
+                return
+    
+    if cadenas:
+        with ThreadPoolExecutor(max_workers=max(1, min(STREAM_PARALLELISM, len(cadenas)))) as pool:
+            list(pool.map(procesar_cadena, cadenas.values()))
+    return resultados
+
 def handler(event, context):
     """
     Handler principal del Lambda
     Procesa eventos de DynamoDB Streams y actualiza ElasticSearch
+    Devuelve en batchItemFailures los SequenceNumber de los registros fallidos
+    (ReportBatchItemFailures): Lambda reintenta desde el primero de ellos
     """
     logger.info("🚀 Iniciando procesamiento de DynamoDB Streams para ElasticSearch")
     
+    records = event.get('Records', [])
     try:
         # Inicializar manager de ElasticSearch
         es_manager = ElasticSearchManager()
         
         # Procesar registros
-        records = event.get('Records', [])
         logger.info(f"📋 Procesando {len(records)} registros")
         
-        successful_records = 0
-        failed_records = 0
-        
-        for record in records:
-            try:
-                if process_dynamodb_record(record, es_manager):
-                    successful_records += 1
-                else:
-                    failed_records += 1
-                    
-            except Exception as e:
-                logger.error(f"❌ Error procesando registro: {e}")
-                failed_records += 1
+        resultados = process_records(records, es_manager)
+        successful_records = sum(1 for r in resultados if r['success'])
+        failed_records = len(resultados) - successful_records
+        # Los fallos permanentes (retry=False) no se reportan: reintentarlos solo bloquearía el shard
+        failures = [
+            {'itemIdentifier': record['dynamodb']['SequenceNumber']}
+            for record, r in zip(records, resultados)
+            if not r['success'] and r.get('retry', True) and record.get('dynamodb', {}).get('SequenceNumber')
+        ]
         
-        logger.info(f"📊 Procesamiento completado: {successful_records} exitosos, {failed_records} fallos")
+        logger.info(f"📊 Procesamiento completado: {successful_records} exitosos, {failed_records} fallos, {len(failures)} para reintento")
         
         # Retornar resultado
         return {
@@ -292,15 +312,21 @@ def handler(event, context):
                 'successful_records': successful_records,
                 'failed_records': failed_records,
                 'total_records': len(records)
-            })
+            }),
+            'batchItemFailures': failures
         }
         
     except Exception as e:
         logger.error(f"❌ Error en handler principal: {e}")
+        # Se reintenta el batch completo
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'error': str(e),
                 'message': 'Error procesando DynamoDB Streams'
-            })
+            }),
+            'batchItemFailures': [
+                {'itemIdentifier': record['dynamodb']['SequenceNumber']}
+                for record in records if record.get('dynamodb', {}).get('SequenceNumber')
+            ]
         }
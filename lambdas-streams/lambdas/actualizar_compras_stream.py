@@ -7,6 +7,7 @@ from typing import Dict, List, Any, Optional
 import logging
 import csv
 from io import StringIO
+from utils.compras_utils import ComprasS3Manager, process_by_key
 
 # Configuración de logging
 logger = logging.getLogger()
@@ -19,6 +20,17 @@ dynamodb_client = boto3.client('dynamodb')
 # Variables de entorno
 BUCKET_NAME = os.environ.get('BUCKET_NAME', 'dev-compras-backup-s3-bucket')
 STAGE = os.environ.get('STAGE', 'dev')
+MANIFEST_PREFIX = 'manifiestos'
+STREAM_PARALLELISM = int(os.environ.get('STREAM_PARALLELISM', '8'))
+
+archivo_manager = ComprasS3Manager(BUCKET_NAME)
+
+def is_ttl_remove(record: Dict[str, Any]) -> bool:
+    """True si el REMOVE lo generó el TTL de DynamoDB (la compra pasa al archivo frío)"""
+    identity = record.get('userIdentity') or {}
+    return (record.get('eventName') == 'REMOVE'
+            and identity.get('type') == 'Service'
+            and identity.get('principalId') == 'dynamodb.amazonaws.com')
 
 class DecimalEncoder(json.JSONEncoder):
     """Encoder personalizado para manejar objetos Decimal de DynamoDB"""
@@ -56,6 +68,8 @@ def format_compra_data(record: Dict[str, Any]) -> Dict[str, Any]:
             'productos': [],
             'metadata': {
                 'event_name': record['eventName'],
+                # Identifica el evento: los lectores descartan las líneas repetidas por reintentos
+                'sequence_number': record['dynamodb'].get('SequenceNumber'),
                 'event_source': record['eventSource'],
                 'aws_region': record['awsRegion'],
                 'processed_at': datetime.now().isoformat(),
@@ -77,16 +91,25 @@ def format_compra_data(record: Dict[str, Any]) -> Dict[str, Any]:
                     }
                     compra_data['productos'].append(producto)
 
-        # Calcular totales
-        total_cantidad = sum(p['cantidad'] for p in compra_data['productos'])
-        total_precio = sum(p['precio_unitario'] * p['cantidad'] for p in compra_data['productos'])
-        
-        compra_data['resumen'] = {
-            'total_productos': len(compra_data['productos']),
-            'total_cantidad': total_cantidad,
-            'total_precio': round(total_precio, 2),
-            'moneda': 'USD'
-        }
+        # Usar los totales persistidos por registrar_compra; calcularlos solo para compras antiguas
+        resumen_data = image_data.get('resumen', {}).get('M')
+        if resumen_data:
+            compra_data['resumen'] = {
+                'total_productos': int(resumen_data.get('total_productos', {}).get('N', '0')),
+                'total_cantidad': int(resumen_data.get('total_cantidad', {}).get('N', '0')),
+                'total_precio': float(resumen_data.get('total_precio', {}).get('N', '0')),
+                'moneda': resumen_data.get('moneda', {}).get('S', 'USD')
+            }
+        else:
+            total_cantidad = sum(p['cantidad'] for p in compra_data['productos'])
+            total_precio = sum(p['precio_unitario'] * p['cantidad'] for p in compra_data['productos'])
+
+            compra_data['resumen'] = {
+                'total_productos': len(compra_data['productos']),
+                'total_cantidad': total_cantidad,
+                'total_precio': round(total_precio, 2),
+                'moneda': 'USD'
+            }
 
         return compra_data
 
@@ -95,16 +118,15 @@ def format_compra_data(record: Dict[str, Any]) -> Dict[str, Any]:
         logger.error(f"Record problemático: {json.dumps(record, indent=2)}")
         return None
 
-def generate_s3_key(compra_data: Dict[str, Any], event_name: str) -> str:
+def generate_s3_prefix(compra_data: Dict[str, Any]) -> str:
     """
-    Genera la clave S3 para almacenar el archivo de compra
+    Genera el prefijo S3 (tenant y día) donde se agrupan las compras del batch
     
     Args:
         compra_data: Datos de la compra
-        event_name: Tipo de evento (INSERT, MODIFY, REMOVE)
         
     Returns:
-        String con la clave S3
+        String con el prefijo S3
     """
     try:
         # Obtener fecha de la compra o usar fecha actual
@@ -122,133 +144,175 @@ def generate_s3_key(compra_data: Dict[str, Any], event_name: str) -> str:
         día = fecha_obj.day
         
         tenant_id = compra_data.get('tenant_id', 'unknown')
-        compra_id = compra_data.get('compra_id', 'unknown')
-        
-        # Timestamp para versioning
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
-        # Estructura: compras/{tenant_id}/{año}/{mes}/{día}/{evento}_{compra_id}_{timestamp}.json
-        s3_key = f"compras/{tenant_id}/{año}/{mes:02d}/{día:02d}/{event_name.lower()}_{compra_id}_{timestamp}.json"
-        
-        return s3_key
+        # Estructura: compras/{tenant_id}/{año}/{mes}/{día}/
+        return f"compras/{tenant_id}/{año}/{mes:02d}/{día:02d}/"
         
     except Exception as e:
-        logger.error(f"Error generando clave S3: {str(e)}")
-        # Fallback key
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        return f"compras/error/{event_name.lower()}_{timestamp}.json"
+        logger.error(f"Error generando prefijo S3: {str(e)}")
+        # Fallback prefix
+        return "compras/error/"
+
+def get_batch_id(records: List[Dict[str, Any]], context: Any) -> str:
+    """
+    Identificador del batch: primer y último SequenceNumber. Un reintento con
+    ReportBatchItemFailures empieza en otro record y escribe objetos nuevos;
+    las compras que ya estaban escritas quedan repetidas y ComprasS3Manager
+    las descarta por (compra_id, sequence_number).
+    """
+    first_seq = records[0].get('dynamodb', {}).get('SequenceNumber') if records else None
+    last_seq = records[-1].get('dynamodb', {}).get('SequenceNumber') if records else None
+    if first_seq:
+        return f"{first_seq}-{last_seq}"
+    return context.aws_request_id if context else 'local'
 
-def save_to_s3(compra_data: Dict[str, Any], s3_key: str) -> bool:
+def save_batch_to_s3(compras: List[Dict[str, Any]], prefix: str, batch_id: str) -> Optional[str]:
     """
-    Guarda los datos de la compra en S3
+    Guarda las compras de un grupo tenant/día del batch en un único objeto
+    NDJSON (una compra por línea) y escribe su manifiesto con los compra_id
+    que contiene
     
     Args:
-        compra_data: Datos de la compra
-        s3_key: Clave S3 donde guardar
+        compras: Datos de las compras del grupo, en orden del stream
+        prefix: Prefijo del grupo (generate_s3_prefix)
+        batch_id: Identificador del batch (get_batch_id)
         
     Returns:
-        Bool indicando si se guardó exitosamente
+        Clave S3 del objeto NDJSON, o None si no se pudo guardar
     """
+    s3_key = f"{prefix}batch-{batch_id}.ndjson"
     try:
-        # Convertir a JSON con encoder personalizado
-        json_data = json.dumps(compra_data, cls=DecimalEncoder, indent=2, ensure_ascii=False)
+        ndjson = ''.join(json.dumps(c, cls=DecimalEncoder, ensure_ascii=False) + '\n' for c in compras)
         
         # Metadatos para el objeto S3
         metadata = {
-            'compra-id': compra_data.get('compra_id', '')[:1024],  # Límite de metadata
-            'tenant-id': compra_data.get('tenant_id', '')[:1024],
-            'user-id': compra_data.get('user_id', '')[:1024],
-            'event-type': compra_data.get('metadata', {}).get('event_name', '')[:1024],
-            'processed-at': compra_data.get('metadata', {}).get('processed_at', '')[:1024],
+            'tenant-id': compras[0].get('tenant_id', '')[:1024],  # Límite de metadata
+            'records': str(len(compras)),
+            'batch-id': batch_id[:1024],
             'stage': STAGE
         }
         
-        # Subir a S3
         s3_client.put_object(
             Bucket=BUCKET_NAME,
             Key=s3_key,
-            Body=json_data.encode('utf-8'),
-            ContentType='application/json',
+            Body=ndjson.encode('utf-8'),
+            ContentType='application/x-ndjson',
             Metadata=metadata,
             ServerSideEncryption='AES256'
         )
         
-        logger.info(f"Compra guardada exitosamente en S3: s3://{BUCKET_NAME}/{s3_key}")
-        return True
+        # El manifiesto va fuera de compras/ para que la tabla compras_json no lo lea;
+        # se escribe después de los datos, así que si existe el objeto también
+        eventos: Dict[str, int] = {}
+        for c in compras:
+            evento = c.get('metadata', {}).get('event_name', 'unknown')
+            eventos[evento] = eventos.get(evento, 0) + 1
+        manifest = {
+            'key': s3_key,
+            'records': len(compras),
+            'compra_ids': list(dict.fromkeys(c.get('compra_id', '') for c in compras)),
+            'eventos': eventos,
+            'batch_id': batch_id,
+            'processed_at': datetime.now().isoformat(),
+            'stage': STAGE
+        }
+        s3_client.put_object(
+            Bucket=BUCKET_NAME,
+            Key=f"{MANIFEST_PREFIX}/{prefix}batch-{batch_id}.json",
+            Body=json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json',
+            ServerSideEncryption='AES256'
+        )
+        
+        logger.info(f"{len(compras)} compras guardadas en S3: s3://{BUCKET_NAME}/{s3_key}")
+        return s3_key
         
     except Exception as e:
         logger.error(f"Error guardando en S3: {str(e)}")
         logger.error(f"Bucket: {BUCKET_NAME}, Key: {s3_key}")
-        return False
+        return None
+
+# Columnas de los part files de analytics (sin header, para poder concatenarlos)
+ANALYTICS_COLUMNS = ['compra_id', 'user_id', 'tenant_id', 'fecha', 'total_productos', 'total_cantidad', 'total_precio']
+ANALYTICS_PREFIX = 'analytics/compras'
 
-def update_csv_analytics(compra_data: Dict[str, Any]) -> bool:
+def build_analytics_row(compra_data: Dict[str, Any]) -> List[Any]:
     """
-    Actualiza el archivo CSV de analytics con la nueva compra
+    Fila de analytics de una compra (columnas de ANALYTICS_COLUMNS)
     
     Args:
         compra_data: Datos de la compra
         
     Returns:
-        Bool indicando si se actualizó exitosamente
+        Lista con los valores de la fila
     """
-    try:
-        csv_key = "analytics/compras_techshop.csv"
+    resumen = compra_data.get('resumen', {})
+    return [
+        compra_data.get('compra_id', ''),
+        compra_data.get('user_id', ''),
+        compra_data.get('tenant_id', ''),
+        compra_data.get('fecha', '').replace('T', ' '),
+        resumen.get('total_productos', 0),
+        resumen.get('total_cantidad', 0),
+        resumen.get('total_precio', 0)
+    ]
+
+def analytics_partition(tenant_id: str, fecha: str) -> str:
+    """Prefijo de la partición tenant_id/fecha (formato Hive, lo lee la tabla de Glue)"""
+    return f"{ANALYTICS_PREFIX}/tenant_id={tenant_id or 'unknown'}/fecha={fecha[:10]}/"
+
+def write_analytics_parts(rows: List[List[Any]], batch_id: str) -> Dict[str, bool]:
+    """
+    Escribe las filas de analytics del batch como part files append-only,
+    uno por partición tenant_id/fecha. Nunca lee ni reescribe archivos
+    existentes: el costo por evento no depende del historial y las invocaciones
+    concurrentes no se pisan. Los duplicados por reentregas del stream los
+    elimina el compactador (compactar_analytics.py).
+    
+    Args:
+        rows: Filas de build_analytics_row
+        batch_id: Identificador del batch (primer y último SequenceNumber)
         
-        # Leer CSV existente
+    Returns:
+        Dict {compra_id: bool} indicando si su fila quedó escrita
+    """
+    partitions: Dict[str, List[List[Any]]] = {}
+    for row in rows:
+        partitions.setdefault(analytics_partition(row[2], row[3]), []).append(row)
+    
+    def write_part(prefix: str) -> bool:
+        partition_rows = partitions[prefix]
+        csv_key = f"{prefix}part-{batch_id}.csv"
         try:
-            response = s3_client.get_object(Bucket=BUCKET_NAME, Key=csv_key)
-            existing_csv = response['Body'].read().decode('utf-8')
-            lines = existing_csv.strip().split('\n')
-            
-            # Verificar si ya existe esta compra
-            compra_id = compra_data.get('compra_id', '')
-            for line in lines[1:]:  # Saltar header
-                if line.startswith(compra_id):
-                    logger.info(f"Compra {compra_id} ya existe en CSV, no se actualiza")
-                    return True
-                    
-        except s3_client.exceptions.NoSuchKey:
-            # Si no existe el archivo, crear con header
-            lines = ['compra_id,user_id,tenant_id,fecha,total_productos,total_cantidad,total_precio']
-            logger.info("Archivo CSV no existe, creando nuevo con header")
-        
-        # Preparar nueva línea CSV
-        fecha_clean = compra_data.get('fecha', '').replace('T', ' ')
-        resumen = compra_data.get('resumen', {})
-        
-        nueva_linea = f"{compra_data.get('compra_id', '')}," \
-                     f"{compra_data.get('user_id', '')}," \
-                     f"{compra_data.get('tenant_id', '')}," \
-                     f"{fecha_clean}," \
-                     f"{resumen.get('total_productos', 0)}," \
-                     f"{resumen.get('total_cantidad', 0)}," \
-                     f"{resumen.get('total_precio', 0)}"
-        
-        # Agregar nueva línea
-        lines.append(nueva_linea)
-        
-        # Recrear CSV
-        csv_content = '\n'.join(lines)
-        
-        # Subir CSV actualizado
-        s3_client.put_object(
-            Bucket=BUCKET_NAME,
-            Key=csv_key,
-            Body=csv_content.encode('utf-8'),
-            ContentType='text/csv',
-            ServerSideEncryption='AES256'
-        )
-        
-        logger.info(f"CSV actualizado exitosamente: s3://{BUCKET_NAME}/{csv_key}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error actualizando CSV: {str(e)}")
-        return False
+            buffer = StringIO()
+            csv.writer(buffer, lineterminator='\n').writerows(partition_rows)
+            s3_client.put_object(
+                Bucket=BUCKET_NAME,
+                Key=csv_key,
+                Body=buffer.getvalue().encode('utf-8'),
+                ContentType='text/csv',
+                ServerSideEncryption='AES256'
+            )
+            logger.info(f"Part file de analytics escrito: s3://{BUCKET_NAME}/{csv_key} ({len(partition_rows)} filas)")
+            return True
+        except Exception as e:
+            logger.error(f"Error escribiendo part file {csv_key}: {str(e)}")
+            return False
+    
+    # Cada partición es un objeto distinto: se escriben todas en paralelo
+    prefixes = list(partitions)
+    written = {}
+    for prefix, ok in zip(prefixes, process_by_key(prefixes, lambda p: p, write_part, STREAM_PARALLELISM)):
+        for row in partitions[prefix]:
+            written[row[0]] = ok
+    
+    return written
 
 def process_stream_record(record: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Procesa un record individual del DynamoDB Stream
+    Procesa un record individual del DynamoDB Stream. No escribe en S3: deja
+    la compra formateada y su prefijo para que lambda_handler la guarde junto
+    con el resto del batch
     
     Args:
         record: Record del stream
@@ -265,44 +329,23 @@ def process_stream_record(record: Dict[str, Any]) -> Dict[str, Any]:
         compra_data = format_compra_data(record)
         
         if not compra_data:
+            # Un reintento daría el mismo resultado: no se reporta como fallido
             return {
                 'success': False,
+                'retry': False,
                 'error': 'No se pudo formatear los datos de la compra',
                 'event_name': event_name
             }
         
-        # Generar clave S3
-        s3_key = generate_s3_key(compra_data, event_name)
-        
-        # Guardar en S3
-        success = save_to_s3(compra_data, s3_key)
-        
-        # Actualizar CSV de analytics solo para eventos INSERT
-        csv_success = False
-        if event_name == 'INSERT':
-            csv_success = update_csv_analytics(compra_data)
-        
-        if success:
-            result = {
-                'success': True,
-                'compra_id': compra_data.get('compra_id'),
-                'tenant_id': compra_data.get('tenant_id'),
-                's3_key': s3_key,
-                'event_name': event_name
-            }
-            
-            # Agregar información del CSV si se procesó
-            if event_name == 'INSERT':
-                result['csv_updated'] = csv_success
-                
-            return result
-        else:
-            return {
-                'success': False,
-                'error': 'Error guardando en S3',
-                'compra_id': compra_data.get('compra_id'),
-                'event_name': event_name
-            }
+        return {
+            'success': True,
+            'compra_id': compra_data.get('compra_id'),
+            'tenant_id': compra_data.get('tenant_id'),
+            'event_name': event_name,
+            's3_prefix': generate_s3_prefix(compra_data),
+            'compra_data': compra_data,
+            'archivar': is_ttl_remove(record)
+        }
             
     except Exception as e:
         logger.error(f"Error procesando record: {str(e)}")
@@ -321,7 +364,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         context: Contexto de Lambda
         
     Returns:
-        Dict con resultado del procesamiento
+        Dict con resultado del procesamiento y batchItemFailures: los
+        SequenceNumber de los records fallidos (ReportBatchItemFailures), para
+        que Lambda reintente desde el primero de ellos y no el batch entero
     """
     logger.info("=== INICIANDO PROCESAMIENTO DE DYNAMODB STREAM ===")
     logger.info(f"Número de records recibidos: {len(event.get('Records', []))}")
@@ -333,28 +378,85 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'details': []
     }
     
+    records = event.get('Records', [])
     try:
+        batch_id = get_batch_id(records, context)
+        
         # Procesar cada record del stream
-        for record in event.get('Records', []):
+        for record in records:
             results['processed'] += 1
-            
-            # Procesar record individual
-            result = process_stream_record(record)
-            
-            if result['success']:
+            detail = process_stream_record(record)
+            detail['sequence_number'] = record.get('dynamodb', {}).get('SequenceNumber')
+            results['details'].append(detail)
+        
+        # S3: un objeto NDJSON (y su manifiesto) por tenant y día para todo el batch
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for detail in results['details']:
+            if detail['success']:
+                groups.setdefault(detail.pop('s3_prefix'), []).append(detail)
+        # Los grupos son objetos distintos, así que se escriben en paralelo
+        s3_keys = process_by_key(
+            list(groups.items()),
+            lambda group: group[0],
+            lambda group: save_batch_to_s3([d['compra_data'] for d in group[1]], group[0], batch_id),
+            STREAM_PARALLELISM
+        )
+        for (prefix, details), s3_key in zip(groups.items(), s3_keys):
+            for detail in details:
+                if s3_key:
+                    detail['s3_key'] = s3_key
+                else:
+                    detail['success'] = False
+                    detail['error'] = 'Error guardando en S3'
+        
+        # Compras expiradas por TTL: copia en el archivo por usuario que lee listar_compras.
+        # Un worker por compra_id, en orden del stream
+        def archive(detail: Dict[str, Any]) -> None:
+            try:
+                archivo = {k: v for k, v in detail['compra_data'].items() if k != 'metadata'}
+                s3_key_archivo = archivo_manager.archive_compra(archivo)
+                logger.info(f"Compra archivada: s3://{BUCKET_NAME}/{s3_key_archivo}")
+            except Exception as e:
+                detail['success'] = False
+                detail['error'] = f"Error archivando compra: {str(e)}"
+        
+        to_archive = [d for d in results['details'] if d.pop('archivar', False) and d['success']]
+        process_by_key(to_archive, lambda d: d.get('compra_id') or '', archive, STREAM_PARALLELISM)
+        
+        analytics_rows = []
+        for detail in results['details']:
+            compra_data = detail.pop('compra_data', None)
+            if detail['success'] and detail['event_name'] == 'INSERT':
+                analytics_rows.append(build_analytics_row(compra_data))
+        
+        # Analytics: un part file por partición tenant_id/fecha para todo el batch
+        if analytics_rows:
+            written = write_analytics_parts(analytics_rows, batch_id)
+            for detail in results['details']:
+                if detail.get('compra_id') in written:
+                    detail['csv_updated'] = written[detail['compra_id']]
+                    # Sin su fila de analytics el INSERT se reintenta (el compactador descarta repetidos)
+                    if detail['event_name'] == 'INSERT' and not detail['csv_updated']:
+                        detail['success'] = False
+                        detail['error'] = 'Error escribiendo analytics'
+        
+        failures = []
+        for detail in results['details']:
+            if detail['success']:
                 results['successful'] += 1
-                logger.info(f"✅ Record procesado exitosamente: {result.get('compra_id', 'unknown')}")
+                logger.info(f"✅ Record procesado exitosamente: {detail.get('compra_id', 'unknown')}")
             else:
                 results['failed'] += 1
-                logger.error(f"❌ Error procesando record: {result.get('error', 'unknown')}")
-            
-            results['details'].append(result)
+                logger.error(f"❌ Error procesando record: {detail.get('error', 'unknown')}")
+                if detail.pop('retry', True) and detail.get('sequence_number'):
+                    failures.append({'itemIdentifier': detail['sequence_number']})
         
         # Log de resumen
         logger.info(f"=== RESUMEN DEL PROCESAMIENTO ===")
         logger.info(f"Procesados: {results['processed']}")
         logger.info(f"Exitosos: {results['successful']}")
         logger.info(f"Fallidos: {results['failed']}")
+        logger.info(f"Reportados para reintento: {len(failures)}")
         
         # Agregar información adicional
         results['bucket'] = BUCKET_NAME
@@ -364,19 +466,25 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'body': json.dumps(results, cls=DecimalEncoder)
+            'body': json.dumps(results, cls=DecimalEncoder),
+            'batchItemFailures': failures
         }
         
     except Exception as e:
         logger.error(f"Error crítico en lambda_handler: {str(e)}")
         
+        # No se sabe qué quedó escrito: se reintenta el batch completo
         error_result = {
             'statusCode': 500,
             'error': str(e),
             'processed': results['processed'],
             'successful': results['successful'],
             'failed': results['failed'],
-            'processed_at': datetime.now().isoformat()
+            'processed_at': datetime.now().isoformat(),
+            'batchItemFailures': [
+                {'itemIdentifier': r['dynamodb']['SequenceNumber']}
+                for r in records if r.get('dynamodb', {}).get('SequenceNumber')
+            ]
         }
         
         return error_result
@@ -0,0 +1,196 @@
+import boto3
+import csv
+import os
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+from typing import Dict, List, Any, Set, Tuple
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sin pyarrow solo se compacta el CSV
+    pa = None
+    pq = None
+
+# Configuración de logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Clientes AWS
+s3_client = boto3.client('s3')
+
+# Variables de entorno
+BUCKET_NAME = os.environ.get('BUCKET_NAME', 'dev-compras-backup-s3-bucket')
+ANALYTICS_PREFIX = 'analytics/compras'
+PARQUET_PREFIX = 'analytics/parquet'
+ANALYTICS_PARQUET = os.environ.get('ANALYTICS_PARQUET', 'true').lower() == 'true'
+
+# tenant_id, year y month van en la ruta (particiones), no como columnas
+if pa:
+    PARQUET_SCHEMA = pa.schema([
+        ('compra_id', pa.string()),
+        ('user_id', pa.string()),
+        ('fecha', pa.string()),
+        ('total_productos', pa.int32()),
+        ('total_cantidad', pa.int32()),
+        ('total_precio', pa.float64())
+    ])
+
+def list_partitions(hasta_fecha: str) -> Dict[str, List[str]]:
+    """
+    Agrupa los objetos de analytics por partición tenant_id/fecha
+
+    Args:
+        hasta_fecha: Solo se incluyen particiones con fecha anterior (YYYY-MM-DD)
+
+    Returns:
+        Dict {prefijo de partición: [claves]}
+    """
+    partitions: Dict[str, List[str]] = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=f"{ANALYTICS_PREFIX}/"):
+        for obj in page.get('Contents', []):
+            prefix, _, name = obj['Key'].rpartition('/')
+            fecha = prefix.rpartition('fecha=')[2]
+            if fecha and fecha < hasta_fecha and name.endswith('.csv'):
+                partitions.setdefault(prefix + '/', []).append(obj['Key'])
+    return partitions
+
+def compact_partition(prefix: str, keys: List[str]) -> Dict[str, Any]:
+    """
+    Une los part files y el compactado anterior de una partición en un único
+    archivo, sin filas repetidas por compra_id (reentregas del stream)
+
+    Args:
+        prefix: Prefijo de la partición
+        keys: Objetos CSV de la partición
+
+    Returns:
+        Dict con el resultado de la compactación
+    """
+    parts = [k for k in keys if k.rpartition('/')[2].startswith('part-')]
+    if not parts:
+        return {'partition': prefix, 'compacted': False}
+
+    rows = {}
+    for key in sorted(keys):
+        content = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)['Body'].read().decode('utf-8')
+        for row in csv.reader(StringIO(content)):
+            if row:
+                rows.setdefault(row[0], row)
+
+    buffer = StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(sorted(rows.values(), key=lambda r: r[3]))
+    compacted_key = f"{prefix}compacted-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}.csv"
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=compacted_key,
+        Body=buffer.getvalue().encode('utf-8'),
+        ContentType='text/csv',
+        ServerSideEncryption='AES256'
+    )
+
+    # Recién con el compactado escrito se borran las fuentes
+    old = [k for k in keys if k != compacted_key]
+    for i in range(0, len(old), 1000):
+        s3_client.delete_objects(
+            Bucket=BUCKET_NAME,
+            Delete={'Objects': [{'Key': k} for k in old[i:i + 1000]], 'Quiet': True}
+        )
+
+    return {'partition': prefix, 'compacted': True, 'files': len(keys), 'rows': len(rows), 'key': compacted_key}
+
+def partition_month(prefix: str) -> Tuple[str, str]:
+    """(tenant_id, YYYY-MM) de un prefijo analytics/compras/tenant_id=X/fecha=YYYY-MM-DD/"""
+    tenant_part, fecha_part = prefix.rstrip('/').split('/')[-2:]
+    return tenant_part.partition('=')[2], fecha_part.partition('=')[2][:7]
+
+def rebuild_parquet_month(tenant_id: str, mes: str) -> Dict[str, Any]:
+    """
+    Regenera el Parquet del mes de un tenant a partir de los CSV compactados de
+    sus días. Un archivo por tenant/año/mes: Athena lee solo las columnas y
+    particiones que usa cada query.
+
+    Args:
+        tenant_id: ID del tenant
+        mes: Mes en formato YYYY-MM
+
+    Returns:
+        Dict con la clave escrita y la cantidad de filas
+    """
+    columns = {name: [] for name in PARQUET_SCHEMA.names}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=f"{ANALYTICS_PREFIX}/tenant_id={tenant_id}/fecha={mes}-"):
+        for obj in page.get('Contents', []):
+            if not obj['Key'].rpartition('/')[2].startswith('compacted-'):
+                continue
+            content = s3_client.get_object(Bucket=BUCKET_NAME, Key=obj['Key'])['Body'].read().decode('utf-8')
+            for row in csv.reader(StringIO(content)):
+                if not row:
+                    continue
+                columns['compra_id'].append(row[0])
+                columns['user_id'].append(row[1])
+                columns['fecha'].append(row[3])
+                columns['total_productos'].append(int(row[4] or 0))
+                columns['total_cantidad'].append(int(row[5] or 0))
+                columns['total_precio'].append(float(row[6] or 0))
+
+    year, month = mes.split('-')
+    parquet_key = f"{PARQUET_PREFIX}/tenant_id={tenant_id}/year={year}/month={month}/compras.parquet"
+    buffer = BytesIO()
+    pq.write_table(pa.table(columns, schema=PARQUET_SCHEMA), buffer, compression='snappy')
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=parquet_key,
+        Body=buffer.getvalue(),
+        ContentType='application/vnd.apache.parquet',
+        ServerSideEncryption='AES256'
+    )
+    return {'key': parquet_key, 'rows': len(columns['compra_id'])}
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Compacta las particiones de analytics de días cerrados (anteriores a hoy, UTC)
+
+    Args:
+        event: Evento programado (opcionales 'hasta_fecha' YYYY-MM-DD y
+               'reconstruir_parquet' para regenerar todos los meses)
+        context: Contexto de Lambda
+
+    Returns:
+        Dict con el resumen de la compactación
+    """
+    hasta_fecha = (event or {}).get('hasta_fecha') or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    logger.info(f"=== COMPACTANDO ANALYTICS ANTERIORES A {hasta_fecha} ===")
+
+    results = {'partitions': 0, 'compacted': 0, 'failed': 0, 'parquet_months': 0}
+    months: Set[Tuple[str, str]] = set()
+    for prefix, keys in list_partitions(hasta_fecha).items():
+        results['partitions'] += 1
+        try:
+            result = compact_partition(prefix, keys)
+            if result['compacted'] or (event or {}).get('reconstruir_parquet'):
+                months.add(partition_month(prefix))
+            if result['compacted']:
+                results['compacted'] += 1
+                logger.info(f"✅ {prefix}: {result['files']} archivos -> {result['rows']} filas")
+        except Exception as e:
+            results['failed'] += 1
+            logger.error(f"❌ Error compactando {prefix}: {str(e)}")
+
+    # Los meses con días recién compactados se regeneran en Parquet
+    if ANALYTICS_PARQUET and months:
+        if pq is None:
+            logger.warning("pyarrow no está instalado: se omite la salida Parquet")
+        for tenant_id, mes in sorted(months) if pq else []:
+            try:
+                result = rebuild_parquet_month(tenant_id, mes)
+                results['parquet_months'] += 1
+                logger.info(f"✅ Parquet {result['key']}: {result['rows']} filas")
+            except Exception as e:
+                results['failed'] += 1
+                logger.error(f"❌ Error generando Parquet {tenant_id}/{mes}: {str(e)}")
+
+    logger.info(f"Resumen: {results}")
+    return results
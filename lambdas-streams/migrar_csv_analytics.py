@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Migración única del CSV de analytics al formato particionado
+
+Reparte analytics/compras_techshop.csv (el archivo que el Lambda reescribía
+completo en cada INSERT) en analytics/compras/tenant_id=X/fecha=YYYY-MM-DD/,
+que es lo que ahora escribe el Lambda como part files y lee la tabla
+compras_analytics de Glue. Cada partición queda como un archivo compactado.
+
+Uso:
+    python migrar_csv_analytics.py --bucket dev-compras-simple-bucket [--dry-run]
+"""
+
+import argparse
+import csv
+from io import StringIO
+
+import boto3
+
+CSV_LEGACY = 'analytics/compras_techshop.csv'
+ANALYTICS_PREFIX = 'analytics/compras'
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Particiona el CSV de analytics por tenant y fecha')
+    parser.add_argument('--bucket', default='dev-compras-simple-bucket')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    s3 = boto3.client('s3')
+    content = s3.get_object(Bucket=args.bucket, Key=CSV_LEGACY)['Body'].read().decode('utf-8')
+    reader = csv.reader(StringIO(content))
+    next(reader, None)  # header
+
+    partitions = {}
+    vistos = set()
+    for row in reader:
+        if not row or row[0] in vistos:
+            continue
+        vistos.add(row[0])
+        prefix = f"{ANALYTICS_PREFIX}/tenant_id={row[2] or 'unknown'}/fecha={row[3][:10]}/"
+        partitions.setdefault(prefix, []).append(row)
+
+    for prefix, rows in sorted(partitions.items()):
+        print(f"📁 {prefix}: {len(rows)} filas")
+        if args.dry_run:
+            continue
+        buffer = StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        s3.put_object(
+            Bucket=args.bucket,
+            Key=f"{prefix}compacted-legacy.csv",
+            Body=buffer.getvalue().encode('utf-8'),
+            ContentType='text/csv',
+            ServerSideEncryption='AES256'
+        )
+
+    print(f"✅ {len(vistos)} compras en {len(partitions)} particiones{' (dry-run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
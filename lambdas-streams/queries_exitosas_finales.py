@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 """
 Script para ejecutar consultas útiles en la tabla CSV de TechShop
+
+Las consultas van contra compras_parquet: los Parquet mensuales que genera el
+compactador en analytics/parquet/tenant_id=X/year=YYYY/month=MM/. Athena solo
+lee las columnas que usa cada query, y filtrar por tenant_id/year/month evita
+leer las demás particiones. compras_analytics (CSV por día) sigue disponible
+para los días que todavía no se compactaron.
+
+tenant_id usa proyección injected, así que Athena exige filtrarlo en cada query.
+
+Uso:
+    python queries_exitosas_finales.py --tenant-id test-tenant
 """
 
+import argparse
 import boto3
 import time
 import logging
@@ -75,9 +87,13 @@ def execute_athena_query(athena_client, query, query_name):
 
 def main():
     """Función principal para ejecutar consultas útiles"""
+    parser = argparse.ArgumentParser(description='Consultas útiles sobre compras_parquet de un tenant')
+    parser.add_argument('--tenant-id', required=True)
+    args = parser.parse_args()
+    tenant = args.tenant_id.replace("'", "''")
     
     print("=" * 80)
-    print("🏪 CONSULTAS ÚTILES PARA TECHSHOP")
+    print(f"🏪 CONSULTAS ÚTILES PARA TECHSHOP - tenant {args.tenant_id}")
     print("=" * 80)
     
     athena_client = boto3.client('athena', region_name='us-east-1')
@@ -86,13 +102,14 @@ def main():
     useful_queries = [
         {
             'name': 'TOP USUARIOS POR COMPRAS',
-            'query': '''
+            'query': f'''
                 SELECT 
                     user_id,
                     COUNT(*) as total_compras,
                     SUM(total_precio) as total_gastado,
                     AVG(total_precio) as promedio_compra
-                FROM "dev-compras-datacatalog"."compras_csv_final"
+                FROM "dev-compras-datacatalog"."compras_parquet"
+                WHERE tenant_id = '{tenant}'
                 GROUP BY user_id
                 ORDER BY total_compras DESC
                 LIMIT 5;
@@ -100,28 +117,29 @@ def main():
         },
         {
             'name': 'RESUMEN DE VENTAS DIARIAS',
-            'query': '''
+            'query': f'''
                 SELECT 
                     SUBSTR(fecha, 1, 10) as fecha_compra,
                     COUNT(*) as total_compras_dia,
                     SUM(total_precio) as ventas_del_dia,
                     SUM(total_productos) as productos_vendidos,
                     ROUND(AVG(total_precio), 2) as ticket_promedio
-                FROM "dev-compras-datacatalog"."compras_csv_final"
+                FROM "dev-compras-datacatalog"."compras_parquet"
+                WHERE tenant_id = '{tenant}'
                 GROUP BY SUBSTR(fecha, 1, 10)
                 ORDER BY fecha_compra DESC;
             '''
         },
         {
             'name': 'COMPRAS MAYORES A $500',
-            'query': '''
+            'query': f'''
                 SELECT 
                     compra_id,
                     user_id,
                     tenant_id,
                     total_precio
-                FROM "dev-compras-datacatalog"."compras_csv_final"
-                WHERE total_precio > 500
+                FROM "dev-compras-datacatalog"."compras_parquet"
+                WHERE tenant_id = '{tenant}' AND total_precio > 500
                 ORDER BY total_precio DESC
                 LIMIT 10;
             '''
@@ -156,8 +174,8 @@ def main():
     print(f"🎉 ANÁLISIS TECHSHOP COMPLETADO")
     print("=" * 80)
     print(f"✅ Consultas exitosas: {successful_queries}/3")
-    print(f"📊 CSV procesado con datos de compras")
-    print(f"📋 Tabla funcional: compras_csv_final")
+    print(f"📊 Parquet mensual procesado con datos de compras")
+    print(f"📋 Tabla funcional: compras_parquet")
     
     if successful_queries >= 1:
         print(f"🎯 ¡Al menos una consulta útil funciona para TechShop!")
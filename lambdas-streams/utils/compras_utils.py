@@ -1,7 +1,8 @@
 import boto3
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, List, Optional
 import logging
 
 # Configuración de logging
@@ -16,6 +17,53 @@ class ComprasS3Manager:
     def __init__(self, bucket_name: str):
         self.bucket_name = bucket_name
         self.s3_client = boto3.client('s3')
+    
+    @staticmethod
+    def event_key(compra: Dict[str, Any]) -> tuple:
+        """
+        Identidad de una compra guardada: (compra_id, sequence_number)
+        
+        Un reintento del stream vuelve a escribir en un objeto nuevo los
+        records que ya se habían guardado; con esta clave se descartan. Los
+        .json anteriores no traen sequence_number y se identifican solo por
+        compra_id.
+        """
+        return (compra.get('compra_id'), compra.get('metadata', {}).get('sequence_number'))
+    
+    @classmethod
+    def dedupe_compras(cls, compras: list) -> list:
+        """Descarta las compras repetidas por reintentos del stream (event_key)"""
+        vistos = set()
+        unicas = []
+        for compra in compras:
+            clave = cls.event_key(compra)
+            if clave in vistos:
+                continue
+            vistos.add(clave)
+            unicas.append(compra)
+        return unicas
+    
+    def read_compras(self, key: str) -> list:
+        """
+        Lee las compras de un objeto de compras/
+        
+        El Lambda de streams escribe un NDJSON por tenant, día y batch (una
+        compra por línea); los .json anteriores tienen una sola compra.
+        
+        Args:
+            key: Clave S3 del objeto
+            
+        Returns:
+            Lista de compras del objeto
+        """
+        content = self.s3_client.get_object(
+            Bucket=self.bucket_name,
+            Key=key
+        )['Body'].read().decode('utf-8')
+        
+        if key.endswith('.ndjson'):
+            return [json.loads(line) for line in content.splitlines() if line.strip()]
+        return [json.loads(content)]
         
     def list_compras_by_tenant(self, tenant_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> list:
         """
@@ -65,20 +113,49 @@ class ComprasS3Manager:
                                 pass
                     
                     # Leer contenido del archivo
-                    content = self.s3_client.get_object(
-                        Bucket=self.bucket_name,
-                        Key=obj['Key']
-                    )
-                    
-                    compra_data = json.loads(content['Body'].read().decode('utf-8'))
-                    compras.append(compra_data)
+                    compras.extend(self.read_compras(obj['Key']))
             
-            return compras
+            return self.dedupe_compras(compras)
             
         except Exception as e:
             logger.error(f"Error listando compras: {str(e)}")
             return []
     
+    @staticmethod
+    def archive_key(tenant_id: str, user_id: str, fecha: str, compra_id: str) -> str:
+        """
+        Clave de una compra en el archivo frío por usuario
+        
+        La fecha va invertida (99999999999999 - YYYYMMDDHHMMSS) para que
+        list_objects_v2, que devuelve las claves en orden ascendente, liste
+        las compras de la más reciente a la más antigua.
+        """
+        digitos = ''.join(c for c in fecha if c.isdigit())[:14].ljust(14, '0')
+        invertida = 99999999999999 - int(digitos)
+        return f"archivo/{tenant_id}/{user_id}/{invertida:014d}_{compra_id}.json"
+    
+    def archive_compra(self, compra_data: Dict[str, Any]) -> str:
+        """
+        Guarda una compra que salió de DynamoDB por TTL en el archivo por usuario
+        
+        Args:
+            compra_data: Datos de la compra (sin metadata del stream)
+            
+        Returns:
+            Clave S3 donde quedó archivada
+        """
+        s3_key = self.archive_key(
+            compra_data['tenant_id'], compra_data['user_id'], compra_data['fecha'], compra_data['compra_id']
+        )
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            Body=json.dumps(compra_data, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json',
+            ServerSideEncryption='AES256'
+        )
+        return s3_key
+    
     def get_compra_by_id(self, compra_id: str) -> Optional[Dict[str, Any]]:
         """
         Obtiene una compra específica por su ID
@@ -98,16 +175,12 @@ class ComprasS3Manager:
             
             if 'Contents' in response:
                 for obj in response['Contents']:
-                    if compra_id in obj['Key']:
-                        content = self.s3_client.get_object(
-                            Bucket=self.bucket_name,
-                            Key=obj['Key']
-                        )
-                        
-                        compra_data = json.loads(content['Body'].read().decode('utf-8'))
-                        
-                        if compra_data.get('compra_id') == compra_id:
-                            return compra_data
+                    # Los .json antiguos llevan el compra_id en la clave; los
+                    # NDJSON de batch hay que leerlos
+                    if compra_id in obj['Key'] or obj['Key'].endswith('.ndjson'):
+                        for compra_data in self.read_compras(obj['Key']):
+                            if compra_data.get('compra_id') == compra_id:
+                                return compra_data
             
             return None
             
@@ -145,15 +218,21 @@ class ComprasS3Manager:
                 }
             }
             
+            vistos = set()
             if 'Contents' in response:
                 for obj in response['Contents']:
                     try:
-                        content = self.s3_client.get_object(
-                            Bucket=self.bucket_name,
-                            Key=obj['Key']
-                        )
-                        
-                        compra_data = json.loads(content['Body'].read().decode('utf-8'))
+                        compras = self.read_compras(obj['Key'])
+                    except Exception as e:
+                        logger.warning(f"Error procesando objeto {obj['Key']}: {str(e)}")
+                        continue
+                    
+                    for compra_data in compras:
+                        # Las líneas repetidas por reintentos del stream se cuentan una vez
+                        clave = self.event_key(compra_data)
+                        if clave in vistos:
+                            continue
+                        vistos.add(clave)
                         
                         # Contadores generales
                         stats['total_compras'] += 1
@@ -173,10 +252,6 @@ class ComprasS3Manager:
                         evento = compra_data.get('metadata', {}).get('event_name', 'unknown')
                         if evento in stats['eventos_por_tipo']:
                             stats['eventos_por_tipo'][evento] += 1
-                        
-                    except Exception as e:
-                        logger.warning(f"Error procesando objeto {obj['Key']}: {str(e)}")
-                        continue
             
             return stats
             
@@ -302,6 +377,41 @@ class ComprasStreamMonitor:
             logger.error(f"Error obteniendo registros del stream: {str(e)}")
             return []
 
+def process_by_key(items: List[Any], key_fn: Callable[[Any], str], fn: Callable[[Any], Any], workers: int) -> List[Any]:
+    """
+    Aplica fn a los items con hasta `workers` hilos, manteniendo el orden por clave
+    
+    Los items con la misma clave forman una cadena que un único worker recorre
+    en el orden recibido; cadenas distintas avanzan en paralelo, así que la
+    latencia tiende a la de la cadena más lenta y no a la suma de todas.
+    
+    Args:
+        items: Elementos a procesar, en orden del stream
+        key_fn: Clave de orden de cada elemento (compra_id, prefijo S3, ...)
+        fn: Función a aplicar; sus excepciones se propagan
+        workers: Grado máximo de paralelismo
+        
+    Returns:
+        Lista con el resultado de fn para cada item, en el orden recibido
+    """
+    cadenas: Dict[str, List[int]] = {}
+    for i, item in enumerate(items):
+        cadenas.setdefault(key_fn(item), []).append(i)
+    
+    resultados: List[Any] = [None] * len(items)
+    
+    def procesar_cadena(indices: List[int]) -> None:
+        for i in indices:
+            resultados[i] = fn(items[i])
+    
+    if len(cadenas) <= 1 or workers <= 1:
+        for indices in cadenas.values():
+            procesar_cadena(indices)
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(cadenas))) as pool:
+            list(pool.map(procesar_cadena, cadenas.values()))
+    return resultados
+
 # Función de utilidad para generar reportes
 def generate_compras_report(bucket_name: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
     """